@@ -5,24 +5,21 @@ Used by Docker and Kubernetes health checks
 """
 
 import sys
-import asyncio
-import httpx
+import json
+import urllib.request
 from loguru import logger
 
 from src.config import settings
 
+HEALTH_URL = f"http://{settings.HOST}:{settings.PORT}/health"
 
-async def check_health():
+
+def check_health():
     """Check if the service is healthy"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"http://{settings.HOST}:{settings.PORT}/health",
-                timeout=5.0
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
+        with urllib.request.urlopen(HEALTH_URL, timeout=settings.HEALTHCHECK_TIMEOUT) as response:
+            if response.status == 200:
+                data = json.load(response)
                 if data.get("status") == "healthy":
                     logger.info("Health check passed")
                     return True
@@ -38,7 +35,7 @@ async def check_health():
 def main():
     """Main health check function"""
     try:
-        is_healthy = asyncio.run(check_health())
+        is_healthy = check_health()
         sys.exit(0 if is_healthy else 1)
     except Exception as e:
         logger.error(f"Health check error: {e}")
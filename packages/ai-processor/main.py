@@ -5,10 +5,13 @@ Main entry point for the AI processing microservice
 """
 
 import os
+import sys
 import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+import orjson
 import uvicorn
 from loguru import logger
 
@@ -17,6 +20,17 @@ from src.api.routes import router
 from src.services.redis_service import RedisService
 from src.services.queue_service import QueueService
 
+# Emit logs from a background thread and skip loguru's frame inspection,
+# which is the costly part of formatting error records on the request path
+logger.remove()
+logger.add(
+    sys.stderr,
+    level="DEBUG" if settings.DEBUG else "INFO",
+    enqueue=True,
+    backtrace=False,
+    diagnose=False
+)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -28,7 +42,10 @@ async def lifespan(app: FastAPI):
     await redis_service.connect()
     
     queue_service = QueueService(redis_service)
-    await queue_service.start_workers()
+    if settings.RUN_QUEUE_WORKERS:
+        await queue_service.start_workers()
+    else:
+        logger.info("Queue workers disabled; serving the API only")
     
     # Store services in app state
     app.state.redis = redis_service
@@ -50,9 +67,23 @@ app = FastAPI(
     title="StepFlow AI Processor",
     description="AI processing service for computer vision, NLP, and content generation",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
+# Registered before CORS so it runs inside it: error responses keep their CORS
+# headers, and the exception stops here instead of reaching the server error
+# middleware, which would log it a second time
+@app.middleware("http")
+async def handle_unexpected_errors(request: Request, call_next):
+    """Log unexpected errors once and return them as a 500 response"""
+    try:
+        return await call_next(request)
+    except Exception as e:
+        logger.error(f"Unhandled error on {request.method} {request.url.path}: {e}")
+        return ORJSONResponse(status_code=500, content={"detail": str(e)})
+
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -62,28 +93,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
 # Include API routes
 app.include_router(router, prefix="/api/v1")
 
 
+# Static payloads are encoded once at import rather than on every request
+_HEALTH_JSON = orjson.dumps({
+    "status": "healthy",
+    "service": "ai-processor",
+    "version": "1.0.0"
+})
+
+_ROOT_JSON = orjson.dumps({
+    "message": "StepFlow AI Processor Service",
+    "version": "1.0.0",
+    "docs": "/docs"
+})
+
+
+def _web_process_count() -> int:
+    """Number of uvicorn processes to start"""
+    # Reload mode only supports a single worker process
+    if settings.DEBUG:
+        return 1
+    
+    # Each process would start its own queue workers, OCR model and Redis pool
+    if settings.RUN_QUEUE_WORKERS and settings.WEB_CONCURRENCY > 1:
+        logger.warning(
+            f"Ignoring WEB_CONCURRENCY={settings.WEB_CONCURRENCY} because queue workers run "
+            f"in-process; set RUN_QUEUE_WORKERS=false for API-only replicas"
+        )
+        return 1
+    
+    return settings.WEB_CONCURRENCY
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "service": "ai-processor",
-        "version": "1.0.0"
-    }
+    return Response(content=_HEALTH_JSON, media_type="application/json")
 
 
 @app.get("/")
 async def root():
     """Root endpoint"""
-    return {
-        "message": "StepFlow AI Processor Service",
-        "version": "1.0.0",
-        "docs": "/docs"
-    }
+    return Response(content=_ROOT_JSON, media_type="application/json")
 
 
 if __name__ == "__main__":
@@ -93,5 +148,8 @@ if __name__ == "__main__":
         host=settings.HOST,
         port=settings.PORT,
         reload=settings.DEBUG,
+        workers=_web_process_count(),
+        loop="uvloop",
+        http="httptools",
         log_level="info" if not settings.DEBUG else "debug"
     )
\ No newline at end of file
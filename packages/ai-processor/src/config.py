@@ -3,23 +3,41 @@ Configuration settings for AI Processor service
 """
 
 import os
-from pydantic_settings import BaseSettings
-from typing import Optional
+from functools import lru_cache
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import Dict, Optional
 
 
 class Settings(BaseSettings):
     """Application settings"""
     
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        case_sensitive=True,
+        frozen=True
+    )
+    
     # Server configuration
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     DEBUG: bool = False
+    # Queue workers, the OCR model and the Redis pool live inside the web process,
+    # so every uvicorn process would start its own set. Run more than one web
+    # process only as API-only replicas (RUN_QUEUE_WORKERS=false) next to a
+    # single process that runs the workers.
+    RUN_QUEUE_WORKERS: bool = True
+    WEB_CONCURRENCY: int = 1  # Ignored while RUN_QUEUE_WORKERS is enabled
     
     # Redis configuration
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_PASSWORD: Optional[str] = None
     REDIS_DB: int = 0
+    # Pooled connections for API requests and short commands. The pool also
+    # reserves one per blocking queue worker and the pub/sub listeners, so its
+    # total size follows the worker settings; keep the sum across processes
+    # under the Redis server's maxclients.
+    REDIS_POOL_HEADROOM: int = 48
     
     # AI Service API Keys
     OPENAI_API_KEY: Optional[str] = None
@@ -32,8 +50,13 @@ class Settings(BaseSettings):
     
     # Processing configuration
     MAX_WORKERS: int = 4
+    # Worker count overrides keyed by task type; other types use MAX_WORKERS.
+    # OCR runs on one shared model, so a single batching worker keeps it busy.
+    WORKERS_PER_TASK: Dict[str, int] = {"ocr_extraction": 1}
     MAX_QUEUE_SIZE: int = 1000
     PROCESSING_TIMEOUT: int = 300  # 5 minutes
+    HEALTHCHECK_TIMEOUT: float = 2.0  # Per-call budget for health probes
+    TASK_WAIT_MAX_SECONDS: float = 30.0  # Longest a result request may wait for completion
     
     # File storage
     TEMP_DIR: str = "/tmp/stepflow"
@@ -42,15 +65,46 @@ class Settings(BaseSettings):
     # Computer Vision settings
     CV_MODEL_PATH: str = "models/"
     OCR_LANGUAGES: str = "en"
+    OCR_USE_GPU: bool = True  # Used only when torch reports a CUDA device
+    OCR_BATCH_SIZE: int = 8
+    OCR_IMAGE_CACHE_TTL: int = 600  # 10 minutes
+    OCR_RESULT_CACHE_TTL: int = 86400  # 24 hours
+    IMAGE_ANALYSIS_MAX_DIMENSION: int = 1280  # Longest side analyzed, in pixels
+    IMAGE_ANALYSIS_CACHE_TTL: int = 21600  # 6 hours
+    # Longest side analyzed, in pixels; 0 analyzes screenshots at full resolution.
+    # Downscaling is faster but can change which steps and elements are detected
+    STEP_DETECTION_MAX_DIMENSION: int = 0
+    # Original-image pixels searched for UI elements around changed regions
+    STEP_DETECTION_ROI_MARGIN: int = 150
+    STEP_DETECTION_IMAGE_CACHE_SIZE: int = 64  # Decoded screenshots kept in memory (~3 MB each)
     
     # Content generation settings
     MAX_CONTENT_LENGTH: int = 4000
     DEFAULT_VOICE_ID: str = "21m00Tcm4TlvDq8ikWAM"  # ElevenLabs default
+    VOICES_CACHE_TTL: int = 86400  # Seconds to reuse the saved ElevenLabs voice list
+    VOICE_MAX_TEXT_LENGTH: int = 20000  # Longest text accepted for synthesis
+    # Characters per ElevenLabs request; must stay under the subscription's limit
+    VOICE_CHUNK_LENGTH: int = 4000
+    VOICE_SYNTHESIS_CONCURRENCY: int = 5  # Concurrent ElevenLabs requests per process
+    CONTENT_CACHE_TTL: int = 86400  # Seconds to reuse an identical completion
+    CONTENT_LOCAL_CACHE_SIZE: int = 1024  # In-process entries in front of Redis
+    CONTENT_LOCAL_CACHE_TTL: int = 300
+    # Opt-in reuse of completions for near-duplicate title/summary prompts
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92  # Minimum cosine similarity for a hit
+    SEMANTIC_CACHE_TTL: int = 3600
+    SEMANTIC_CACHE_SIZE: int = 1000
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
+    def worker_count(self, queue_name: str) -> int:
+        """Number of queue workers to run for a task type"""
+        return self.WORKERS_PER_TASK.get(queue_name, self.MAX_WORKERS)
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide settings instance"""
+    return Settings()
 
 
 # Global settings instance
-settings = Settings()
\ No newline at end of file
+settings = get_settings()
\ No newline at end of file
@@ -2,7 +2,8 @@
 Pydantic models for API requests and responses
 """
 
-from typing import List, Optional, Dict, Any, Union
+from dataclasses import dataclass
+from typing import List, Optional, Dict, Any, Union, Literal, Annotated
 from pydantic import BaseModel, Field, HttpUrl
 from enum import Enum
 
@@ -27,7 +28,7 @@ class TaskType(str, Enum):
 # Base models
 class BaseTask(BaseModel):
     """Base task model"""
-    task_id: str = Field(..., description="Unique task identifier")
+    task_id: Optional[str] = Field(None, description="Unique task identifier (assigned on submission)")
     task_type: TaskType = Field(..., description="Type of processing task")
     priority: int = Field(default=1, ge=1, le=10, description="Task priority (1-10)")
     metadata: Dict[str, Any] = Field(default_factory=dict, description="Additional metadata")
@@ -47,7 +48,7 @@ class TaskResult(BaseModel):
 # Step Detection models
 class StepDetectionRequest(BaseTask):
     """Step detection request model"""
-    task_type: TaskType = TaskType.STEP_DETECTION
+    task_type: Literal[TaskType.STEP_DETECTION] = TaskType.STEP_DETECTION
     screenshot_url: HttpUrl = Field(..., description="URL to screenshot image")
     previous_screenshot_url: Optional[HttpUrl] = Field(None, description="Previous screenshot for comparison")
     session_context: Dict[str, Any] = Field(default_factory=dict, description="Session context information")
@@ -74,7 +75,7 @@ class StepDetectionResult(BaseModel):
 # OCR models
 class OCRRequest(BaseTask):
     """OCR extraction request model"""
-    task_type: TaskType = TaskType.OCR_EXTRACTION
+    task_type: Literal[TaskType.OCR_EXTRACTION] = TaskType.OCR_EXTRACTION
     image_url: HttpUrl = Field(..., description="URL to image for OCR")
     languages: List[str] = Field(default=["en"], description="OCR languages")
     extract_regions: Optional[List[Dict[str, float]]] = Field(None, description="Specific regions to extract")
@@ -91,7 +92,7 @@ class OCRResult(BaseModel):
 # Content Generation models
 class ContentGenerationRequest(BaseTask):
     """Content generation request model"""
-    task_type: TaskType = TaskType.CONTENT_GENERATION
+    task_type: Literal[TaskType.CONTENT_GENERATION] = TaskType.CONTENT_GENERATION
     prompt: str = Field(..., description="Generation prompt")
     content_type: str = Field(..., description="Type of content to generate")
     context: Dict[str, Any] = Field(default_factory=dict, description="Additional context")
@@ -108,7 +109,7 @@ class ContentGenerationResult(BaseModel):
 # Voice Synthesis models
 class VoiceSynthesisRequest(BaseTask):
     """Voice synthesis request model"""
-    task_type: TaskType = TaskType.VOICE_SYNTHESIS
+    task_type: Literal[TaskType.VOICE_SYNTHESIS] = TaskType.VOICE_SYNTHESIS
     text: str = Field(..., description="Text to synthesize")
     voice_id: Optional[str] = Field(None, description="Voice ID for synthesis")
     voice_settings: Dict[str, Any] = Field(default_factory=dict, description="Voice configuration")
@@ -124,7 +125,7 @@ class VoiceSynthesisResult(BaseModel):
 # Image Analysis models
 class ImageAnalysisRequest(BaseTask):
     """Image analysis request model"""
-    task_type: TaskType = TaskType.IMAGE_ANALYSIS
+    task_type: Literal[TaskType.IMAGE_ANALYSIS] = TaskType.IMAGE_ANALYSIS
     image_url: HttpUrl = Field(..., description="URL to image for analysis")
     analysis_types: List[str] = Field(..., description="Types of analysis to perform")
 
@@ -136,6 +137,19 @@ class ImageAnalysisResult(BaseModel):
     image_metadata: Dict[str, Any]
 
 
+# Batch submission model
+BatchTaskRequest = Annotated[
+    Union[
+        StepDetectionRequest,
+        OCRRequest,
+        ContentGenerationRequest,
+        VoiceSynthesisRequest,
+        ImageAnalysisRequest,
+    ],
+    Field(discriminator="task_type")
+]
+
+
 # Queue models
 class QueueStatus(BaseModel):
     """Queue status model"""
@@ -147,6 +161,23 @@ class QueueStatus(BaseModel):
     workers_active: int
 
 
+# Internal queue statistics (not part of the API)
+@dataclass(slots=True)
+class QueueInfo:
+    """Pending work for a single task queue"""
+    name: str
+    pending_tasks: int
+    workers: int
+
+
+@dataclass(slots=True)
+class QueueStats:
+    """Snapshot of all task queues and their workers"""
+    per_queue: List[QueueInfo]
+    total_workers: int
+    active_workers: int
+
+
 # Health check model
 class HealthStatus(BaseModel):
     """Health status model"""
@@ -154,4 +185,19 @@ class HealthStatus(BaseModel):
     service: str
     version: str
     uptime: float
-    queue_status: Optional[QueueStatus] = None
\ No newline at end of file
+    queue_status: Optional[QueueStatus] = None
+
+
+# Resolve every request/response schema at import so validator construction
+# happens during startup rather than on the first request to each endpoint
+for _model in (
+    StepDetectionRequest,
+    OCRRequest,
+    ContentGenerationRequest,
+    VoiceSynthesisRequest,
+    ImageAnalysisRequest,
+    TaskResult,
+    QueueStatus,
+    HealthStatus,
+):
+    _model.model_rebuild()
@@ -2,20 +2,88 @@
 Content generation service using OpenAI GPT
 """
 
-from typing import Dict, Any, Optional
+import hashlib
+import json
+import time
+from typing import Dict, Any, List, Optional
+import httpx
+import numpy as np
 import openai
+from cachetools import TTLCache
 from loguru import logger
 import asyncio
 
 from ..config import settings
+from .redis_service import RedisService
+
+OPENAI_MODEL = "gpt-3.5-turbo"
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Short, topic-like outputs where a near-duplicate prompt can reuse a completion
+_SEMANTIC_CACHE_TYPES = frozenset({"guide_title", "guide_summary"})
+
+
+class SemanticCache:
+    """Fixed-size in-process cache of completions looked up by embedding similarity"""
+    
+    def __init__(self, capacity: int, threshold: float, ttl: float):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.vectors: Optional[np.ndarray] = None
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.namespaces = np.full(capacity, -1, dtype=np.int32)
+        self.responses: List[Optional[str]] = [None] * capacity
+        self.namespace_ids: Dict[str, int] = {}
+        self.next_slot = 0
+    
+    def lookup(self, namespace: str, vector: np.ndarray) -> Optional[str]:
+        """Return the closest fresh completion in the namespace above the threshold"""
+        namespace_id = self.namespace_ids.get(namespace)
+        if self.vectors is None or namespace_id is None:
+            return None
+        
+        scores = self.vectors @ vector
+        valid = (self.namespaces == namespace_id) & (self.timestamps > time.time() - self.ttl)
+        scores = np.where(valid, scores, -1.0)
+        
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return self.responses[best]
+    
+    def add(self, namespace: str, vector: np.ndarray, response: str):
+        """Store a completion, overwriting the oldest entry once full"""
+        if self.vectors is None:
+            self.vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+        
+        slot = self.next_slot % self.capacity
+        self.vectors[slot] = vector
+        self.timestamps[slot] = time.time()
+        self.namespaces[slot] = self.namespace_ids.setdefault(namespace, len(self.namespace_ids))
+        self.responses[slot] = response
+        self.next_slot += 1
 
 
 class ContentGenerationService:
     """Service for generating content using AI"""
     
-    def __init__(self):
+    def __init__(self, redis_service: Optional[RedisService] = None):
         self.client = None
         self.initialized = False
+        self.redis = redis_service
+        # Process-local layer in front of Redis for back-to-back identical requests
+        self.local_cache: TTLCache = TTLCache(
+            maxsize=settings.CONTENT_LOCAL_CACHE_SIZE,
+            ttl=settings.CONTENT_LOCAL_CACHE_TTL
+        )
+        self.semantic_cache: Optional[SemanticCache] = None
+        if settings.SEMANTIC_CACHE_ENABLED:
+            self.semantic_cache = SemanticCache(
+                capacity=settings.SEMANTIC_CACHE_SIZE,
+                threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+                ttl=settings.SEMANTIC_CACHE_TTL
+            )
     
     async def _initialize(self):
         """Initialize the content generation service"""
@@ -27,13 +95,25 @@ class ContentGenerationService:
                 raise ValueError("OPENAI_API_KEY is required for content generation")
             
             logger.info("Initializing content generation service")
-            self.client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+            # Concurrent worker calls share one multiplexed HTTP/2 connection
+            # instead of each paying for its own TCP and TLS handshake
+            self.client = openai.AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                http_client=httpx.AsyncClient(http2=True)
+            )
             self.initialized = True
             logger.info("Content generation service initialized")
         except Exception as e:
             logger.error(f"Failed to initialize content generation service: {e}")
             raise
     
+    async def close(self):
+        """Close the shared OpenAI HTTP client"""
+        if self.client:
+            await self.client.close()
+            self.client = None
+            self.initialized = False
+    
     async def process(self, task_data: Dict[str, Any]) -> Dict[str, Any]:
         """Process content generation task"""
         await self._initialize()
@@ -49,33 +129,45 @@ class ContentGenerationService:
         if not content_type:
             raise ValueError("content_type is required")
         
+        # Canonical context encoding, computed once so prompts are byte-stable
+        ctx_str = json.dumps(context, sort_keys=True, separators=(",", ":"), default=str)
+        
+        local_key = (content_type, prompt, ctx_str, max_length)
+        cached = self.local_cache.get(local_key)
+        if cached is not None:
+            logger.debug(f"Local content cache HIT for {content_type}")
+            return cached
+        
         # Generate content based on type
         if content_type == "step_description":
-            generated_content = await self._generate_step_description(prompt, context, max_length)
+            generated_content = await self._generate_step_description(prompt, ctx_str, max_length)
         elif content_type == "guide_title":
-            generated_content = await self._generate_guide_title(prompt, context, max_length)
+            generated_content = await self._generate_guide_title(prompt, ctx_str, max_length)
         elif content_type == "guide_summary":
-            generated_content = await self._generate_guide_summary(prompt, context, max_length)
+            generated_content = await self._generate_guide_summary(prompt, ctx_str, max_length)
         elif content_type == "step_instructions":
-            generated_content = await self._generate_step_instructions(prompt, context, max_length)
+            generated_content = await self._generate_step_instructions(prompt, ctx_str, max_length)
         else:
-            generated_content = await self._generate_generic_content(prompt, context, max_length)
+            generated_content = await self._generate_generic_content(prompt, ctx_str, max_length)
         
-        return {
+        result = {
             "generated_content": generated_content,
             "content_type": content_type,
             "generation_metadata": {
                 "prompt_length": len(prompt),
                 "context_keys": list(context.keys()),
                 "max_length": max_length,
-                "model_used": "gpt-3.5-turbo"
+                "model_used": OPENAI_MODEL
             }
         }
+        self.local_cache[local_key] = result
+        
+        return result
     
     async def _generate_step_description(
         self, 
         prompt: str, 
-        context: Dict[str, Any], 
+        ctx_str: str, 
         max_length: int
     ) -> str:
         """Generate a description for a user interaction step"""
@@ -83,136 +175,155 @@ class ContentGenerationService:
         system_prompt = """You are an expert at creating clear, concise descriptions of user interface interactions. 
         Generate a brief, actionable description of the user step based on the provided information.
         Focus on what the user did and why it's important in the workflow.
-        Keep descriptions under 100 words and use simple, clear language."""
-        
-        user_prompt = f"""
-        Context: {context}
-        
-        Generate a clear description for this user interaction step:
-        {prompt}
+        Keep descriptions under 100 words and use simple, clear language.
         
         The description should be:
         - Clear and actionable
         - Focused on the user's intent
         - Suitable for a step-by-step guide
-        """
         
-        return await self._call_openai(system_prompt, user_prompt, max_tokens=150)
+        The user message contains the step to describe, followed by its context."""
+        
+        user_prompt = self._build_user_prompt(prompt, ctx_str)
+        
+        return await self._call_openai(
+            system_prompt, user_prompt, max_tokens=150, cache_key="step_description"
+        )
     
     async def _generate_guide_title(
         self, 
         prompt: str, 
-        context: Dict[str, Any], 
+        ctx_str: str, 
         max_length: int
     ) -> str:
         """Generate a title for a guide"""
         
         system_prompt = """You are an expert at creating engaging, descriptive titles for how-to guides.
         Generate a clear, concise title that accurately describes what the guide teaches.
-        Titles should be under 60 characters and use action-oriented language."""
-        
-        user_prompt = f"""
-        Context: {context}
-        
-        Generate an engaging title for a guide about:
-        {prompt}
+        Titles should be under 60 characters and use action-oriented language.
         
         The title should be:
         - Clear and descriptive
         - Action-oriented (How to...)
         - Under 60 characters
         - Engaging for users
-        """
         
-        return await self._call_openai(system_prompt, user_prompt, max_tokens=50)
+        The user message contains the guide topic, followed by its context."""
+        
+        user_prompt = self._build_user_prompt(prompt, ctx_str)
+        
+        return await self._call_openai(
+            system_prompt, user_prompt, max_tokens=50, cache_key="guide_title"
+        )
     
     async def _generate_guide_summary(
         self, 
         prompt: str, 
-        context: Dict[str, Any], 
+        ctx_str: str, 
         max_length: int
     ) -> str:
         """Generate a summary for a guide"""
         
         system_prompt = """You are an expert at creating concise, informative summaries for instructional guides.
         Generate a brief summary that explains what the guide covers and what users will learn.
-        Keep summaries under 200 words and focus on the value to the user."""
-        
-        user_prompt = f"""
-        Context: {context}
-        
-        Generate a helpful summary for a guide about:
-        {prompt}
+        Keep summaries under 200 words and focus on the value to the user.
         
         The summary should:
         - Explain what the guide covers
         - Highlight key learning outcomes
         - Be under 200 words
         - Appeal to the target audience
-        """
         
-        return await self._call_openai(system_prompt, user_prompt, max_tokens=250)
+        The user message contains the guide topic, followed by its context."""
+        
+        user_prompt = self._build_user_prompt(prompt, ctx_str)
+        
+        return await self._call_openai(
+            system_prompt, user_prompt, max_tokens=250, cache_key="guide_summary"
+        )
     
     async def _generate_step_instructions(
         self, 
         prompt: str, 
-        context: Dict[str, Any], 
+        ctx_str: str, 
         max_length: int
     ) -> str:
         """Generate detailed instructions for a step"""
         
         system_prompt = """You are an expert at creating clear, detailed instructions for software interactions.
         Generate step-by-step instructions that are easy to follow and understand.
-        Use numbered lists and be specific about what users should click, type, or look for."""
-        
-        user_prompt = f"""
-        Context: {context}
-        
-        Generate detailed instructions for:
-        {prompt}
+        Use numbered lists and be specific about what users should click, type, or look for.
         
         The instructions should:
         - Be specific and actionable
         - Use numbered steps if multiple actions are needed
         - Include what users should expect to see
         - Be clear for beginners
-        """
         
-        return await self._call_openai(system_prompt, user_prompt, max_tokens=300)
+        The user message contains the task to explain, followed by its context."""
+        
+        user_prompt = self._build_user_prompt(prompt, ctx_str)
+        
+        return await self._call_openai(
+            system_prompt, user_prompt, max_tokens=300, cache_key="step_instructions"
+        )
     
     async def _generate_generic_content(
         self, 
         prompt: str, 
-        context: Dict[str, Any], 
+        ctx_str: str, 
         max_length: int
     ) -> str:
         """Generate generic content"""
         
         system_prompt = """You are a helpful assistant that generates clear, useful content based on user requests.
-        Create content that is well-structured, informative, and appropriate for the given context."""
+        Create content that is well-structured, informative, and appropriate for the given context.
         
-        user_prompt = f"""
-        Context: {context}
+        The user message contains the request, followed by its context."""
         
-        Generate content for:
-        {prompt}
-        """
+        user_prompt = self._build_user_prompt(prompt, ctx_str)
         
         max_tokens = min(max_length // 4, 1000)  # Rough estimate: 4 chars per token
-        return await self._call_openai(system_prompt, user_prompt, max_tokens=max_tokens)
+        return await self._call_openai(
+            system_prompt, user_prompt, max_tokens=max_tokens, cache_key="generic"
+        )
+    
+    def _build_user_prompt(self, prompt: str, ctx_str: str) -> str:
+        """Put the per-request fields last so the static system prompt stays a shared prefix"""
+        return f"{prompt}\n\nContext: {ctx_str}"
     
     async def _call_openai(
         self, 
         system_prompt: str, 
         user_prompt: str, 
         max_tokens: int = 500,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        cache_key: Optional[str] = None
     ) -> str:
         """Make a call to OpenAI API"""
         
+        # Identical prompts are served from Redis instead of another API round-trip
+        response_key = self._response_cache_key(system_prompt, user_prompt, max_tokens, temperature)
+        if self.redis:
+            cached = await self.redis.cache_get(response_key)
+            if cached:
+                logger.debug(f"OpenAI cache HIT {response_key}")
+                return cached["content"]
+            logger.debug(f"OpenAI cache MISS {response_key}")
+        
+        # Near-duplicate titles and summaries can reuse a similar earlier completion
+        embedding = None
+        if self.semantic_cache and cache_key in _SEMANTIC_CACHE_TYPES:
+            embedding = await self._embed(user_prompt)
+            if embedding is not None:
+                cached_content = self.semantic_cache.lookup(cache_key, embedding)
+                if cached_content is not None:
+                    logger.debug(f"Semantic cache HIT for {cache_key}")
+                    return cached_content
+        
         try:
             response = await self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+                model=OPENAI_MODEL,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
@@ -221,17 +332,54 @@ class ContentGenerationService:
                 temperature=temperature,
                 top_p=1.0,
                 frequency_penalty=0.0,
-                presence_penalty=0.0
+                presence_penalty=0.0,
+                # Route calls sharing a system prompt to the same OpenAI prompt cache
+                extra_body={"prompt_cache_key": f"stepflow-{cache_key}"} if cache_key else None
             )
             
             generated_content = response.choices[0].message.content.strip()
             
             logger.debug(f"Generated content: {len(generated_content)} characters")
-            return generated_content
             
         except Exception as e:
             logger.error(f"Error calling OpenAI API: {e}")
             raise RuntimeError(f"Content generation failed: {str(e)}")
+        
+        if self.redis:
+            await self.redis.cache_set(
+                response_key,
+                {"content": generated_content},
+                ttl=settings.CONTENT_CACHE_TTL
+            )
+        
+        if embedding is not None:
+            self.semantic_cache.add(cache_key, embedding, generated_content)
+        
+        return generated_content
+    
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        """Embed text as a unit vector, or None if the embedding call fails"""
+        try:
+            response = await self.client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+            vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+            return vector / np.linalg.norm(vector)
+        except Exception as e:
+            logger.warning(f"Embedding failed, skipping semantic cache: {e}")
+            return None
+    
+    def _response_cache_key(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        temperature: float
+    ) -> str:
+        """Build the Redis key for a completion from everything that shapes it"""
+        digest = hashlib.sha256()
+        for part in (OPENAI_MODEL, str(max_tokens), str(temperature), system_prompt, user_prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return f"openai:completion:{digest.hexdigest()}"
     
     async def _enhance_prompt_with_context(self, prompt: str, context: Dict[str, Any]) -> str:
         """Enhance the prompt with additional context"""
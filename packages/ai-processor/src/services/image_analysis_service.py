@@ -2,9 +2,12 @@
 Image analysis service for computer vision tasks
 """
 
+import hashlib
+import os
+import threading
 import cv2
 import numpy as np
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Sequence
 import httpx
 from loguru import logger
 import asyncio
@@ -12,14 +15,28 @@ from io import BytesIO
 from PIL import Image
 
 from ..config import settings
+from .redis_service import RedisService
+
+# YuNet face detector from the OpenCV model zoo, looked up in CV_MODEL_PATH
+YUNET_MODEL_FILE = "face_detection_yunet_2023mar.onnx"
 
 
 class ImageAnalysisService:
     """Service for analyzing images using computer vision"""
     
-    def __init__(self):
+    # Shared across instances so face models are loaded once per process
+    _face_detector: Optional[cv2.FaceDetectorYN] = None
+    _face_cascade: Optional[cv2.CascadeClassifier] = None
+    # Analyzers run on worker threads; the face models are not safe to share concurrently
+    _face_lock = threading.Lock()
+    
+    def __init__(self, redis_service: Optional[RedisService] = None):
         self.initialized = False
         self.models = {}
+        self.http: Optional[httpx.AsyncClient] = None
+        self.redis = redis_service
+        self.use_cuda = False
+        self._cuda_lock = threading.Lock()
     
     async def _initialize(self):
         """Initialize the image analysis service"""
@@ -28,14 +45,66 @@ class ImageAnalysisService:
         
         try:
             logger.info("Initializing image analysis service")
-            # Initialize any ML models here
-            # For example: YOLO, face detection, etc.
+            self._load_face_models()
+            self.models["face_detector"] = ImageAnalysisService._face_detector
+            self.models["face_cascade"] = ImageAnalysisService._face_cascade
+            self._init_cuda()
+            
+            # Keep connections to image hosts alive between downloads
+            self.http = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=32),
+                timeout=30.0
+            )
             self.initialized = True
             logger.info("Image analysis service initialized")
         except Exception as e:
             logger.error(f"Failed to initialize image analysis service: {e}")
             raise
     
+    async def close(self):
+        """Close the shared HTTP client"""
+        if self.http:
+            await self.http.aclose()
+            self.http = None
+            self.initialized = False
+    
+    def _init_cuda(self):
+        """Enable the GPU preprocessing path when OpenCV was built with CUDA and a device is present"""
+        try:
+            self.use_cuda = cv2.cuda.getCudaEnabledDeviceCount() > 0
+            if self.use_cuda:
+                self.models["cuda_gaussian"] = cv2.cuda.createGaussianFilter(
+                    cv2.CV_8UC1, cv2.CV_8UC1, (5, 5), 0
+                )
+                self.models["cuda_canny"] = cv2.cuda.createCannyEdgeDetector(50, 150)
+                logger.info("Using CUDA for image preprocessing")
+        except (AttributeError, cv2.error) as e:
+            logger.warning(f"CUDA preprocessing unavailable: {e}")
+            self.use_cuda = False
+    
+    @classmethod
+    def _load_face_models(cls):
+        """Load YuNet if its model file is available, otherwise the Haar cascade"""
+        if cls._face_detector is not None or cls._face_cascade is not None:
+            return
+        
+        yunet_path = os.path.join(settings.CV_MODEL_PATH, YUNET_MODEL_FILE)
+        if os.path.exists(yunet_path):
+            cls._face_detector = cv2.FaceDetectorYN.create(
+                yunet_path,
+                "",
+                (320, 320),
+                score_threshold=0.8,
+                nms_threshold=0.3
+            )
+            logger.info(f"Using YuNet face detector from {yunet_path}")
+        else:
+            cls._face_cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+            )
+            logger.warning(f"{yunet_path} not found, falling back to Haar cascade face detection")
+    
     async def process(self, task_data: Dict[str, Any]) -> Dict[str, Any]:
         """Process image analysis task"""
         await self._initialize()
@@ -49,66 +118,161 @@ class ImageAnalysisService:
         if not analysis_types:
             raise ValueError("analysis_types is required")
         
+        # Repeat analyses of the same URL are served from Redis
+        url_key = self._result_cache_key(f"url:{image_url}", analysis_types)
+        if self.redis:
+            cached = await self.redis.cache_get(url_key)
+            if cached:
+                logger.debug(f"Image analysis cache HIT for {image_url}")
+                return cached
+        
         # Download image
-        image = await self._download_image(image_url)
+        content = await self._download_image_bytes(image_url)
         
-        # Perform requested analyses
-        analysis_results = {}
-        detected_objects = []
+        # Different URLs (e.g. re-signed links) often serve byte-identical images
+        content_key = self._result_cache_key(
+            f"sha256:{hashlib.sha256(content).hexdigest()}", analysis_types
+        )
+        if self.redis:
+            cached = await self.redis.cache_get(content_key)
+            if cached:
+                logger.debug(f"Image analysis content cache HIT for {image_url}")
+                await self.redis.cache_set(url_key, cached, ttl=settings.IMAGE_ANALYSIS_CACHE_TTL)
+                return cached
         
-        for analysis_type in analysis_types:
-            if analysis_type == "object_detection":
-                objects = await self._detect_objects(image)
-                detected_objects.extend(objects)
-                analysis_results["object_detection"] = objects
-            
-            elif analysis_type == "face_detection":
-                faces = await self._detect_faces(image)
-                analysis_results["face_detection"] = faces
-            
-            elif analysis_type == "color_analysis":
-                colors = await self._analyze_colors(image)
-                analysis_results["color_analysis"] = colors
-            
-            elif analysis_type == "edge_detection":
-                edges = await self._detect_edges(image)
-                analysis_results["edge_detection"] = edges
-            
-            elif analysis_type == "image_quality":
-                quality = await self._analyze_image_quality(image)
-                analysis_results["image_quality"] = quality
-            
+        image = await asyncio.to_thread(self._decode_image, content)
+        
+        # Analyze a downscaled copy; detections are mapped back to full resolution
+        analysis_image, gray, edges, contours, scale = await asyncio.to_thread(
+            self._prepare_image, image, analysis_types
+        )
+        
+        analyzers = {
+            "object_detection": lambda: self._detect_objects(analysis_image, gray, edges, contours, scale),
+            "face_detection": lambda: self._detect_faces(analysis_image, gray, scale),
+            "color_analysis": lambda: self._analyze_colors(analysis_image, gray),
+            "edge_detection": lambda: self._detect_edges(gray, edges, contours),
+            "image_quality": lambda: self._analyze_image_quality(image, gray),
+        }
+        
+        requested = []
+        for analysis_type in dict.fromkeys(analysis_types):
+            if analysis_type in analyzers:
+                requested.append(analysis_type)
             else:
                 logger.warning(f"Unknown analysis type: {analysis_type}")
         
+        # Independent analyses run in parallel off the event loop
+        results = await asyncio.gather(
+            *(asyncio.to_thread(analyzers[analysis_type]) for analysis_type in requested)
+        )
+        analysis_results = dict(zip(requested, results))
+        detected_objects = analysis_results.get("object_detection", [])
+        
         # Get image metadata
         image_metadata = await self._get_image_metadata(image)
         
-        return {
+        result = {
             "analysis_results": analysis_results,
             "detected_objects": detected_objects,
             "image_metadata": image_metadata
         }
+        
+        if self.redis:
+            for key in (url_key, content_key):
+                await self.redis.cache_set(key, result, ttl=settings.IMAGE_ANALYSIS_CACHE_TTL)
+        
+        return result
     
-    async def _download_image(self, url: str) -> np.ndarray:
-        """Download image from URL and convert to OpenCV format"""
+    def _result_cache_key(self, source: str, analysis_types: List[str]) -> str:
+        """Build the Redis key for an image source and set of analyses"""
+        key_source = source + "|" + ",".join(sorted(set(analysis_types)))
+        return f"image_analysis:{hashlib.sha256(key_source.encode('utf-8')).hexdigest()}"
+    
+    async def _download_image_bytes(self, url: str) -> bytes:
+        """Download the raw image bytes from URL"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, timeout=30.0)
-                response.raise_for_status()
-                
-                # Convert to PIL Image then to OpenCV
-                pil_image = Image.open(BytesIO(response.content))
-                cv_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-                
-                return cv_image
-                
+            response = await self.http.get(url)
+            response.raise_for_status()
+            return response.content
+            
         except Exception as e:
             logger.error(f"Failed to download image from {url}: {e}")
             raise
     
-    async def _detect_objects(self, image: np.ndarray) -> List[Dict[str, Any]]:
-        """Detect objects in the image"""
+    def _decode_image(self, content: bytes) -> np.ndarray:
+        """Decode image bytes to OpenCV format"""
+        # Decode straight to BGR, falling back to PIL for formats OpenCV can't read
+        cv_image = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if cv_image is None:
+            pil_image = Image.open(BytesIO(content)).convert("RGB")
+            cv_image = cv2.cvtColor(np.asarray(pil_image), cv2.COLOR_RGB2BGR)
+        
+        return cv_image
+    
+    def _prepare_image(self, image: np.ndarray, analysis_types: List[str]):
+        """Downscale the image and compute the intermediates shared by the analyzers"""
+        scale = min(1.0, settings.IMAGE_ANALYSIS_MAX_DIMENSION / max(image.shape[:2]))
+        needs_edges = "object_detection" in analysis_types or "edge_detection" in analysis_types
+        
+        if self.use_cuda:
+            analysis_image, gray, edges = self._prepare_image_cuda(image, scale, needs_edges)
+        else:
+            if scale < 1.0:
+                analysis_image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            else:
+                analysis_image = image
+            
+            # Shared intermediates, computed once instead of in every analyzer
+            gray = cv2.cvtColor(analysis_image, cv2.COLOR_BGR2GRAY)
+            edges = self._canny_edges(gray) if needs_edges else None
+        
+        contours = None
+        if edges is not None:
+            contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        
+        return analysis_image, gray, edges, contours, scale
+    
+    def _prepare_image_cuda(self, image: np.ndarray, scale: float, needs_edges: bool):
+        """GPU version of the resize, grayscale and edge chain; intermediates stay on the device"""
+        with self._cuda_lock:
+            gpu_image = cv2.cuda_GpuMat()
+            gpu_image.upload(image)
+            
+            analysis_image = image
+            if scale < 1.0:
+                height, width = image.shape[:2]
+                gpu_image = cv2.cuda.resize(
+                    gpu_image,
+                    (round(width * scale), round(height * scale)),
+                    interpolation=cv2.INTER_AREA
+                )
+                analysis_image = gpu_image.download()
+            
+            gpu_gray = cv2.cuda.cvtColor(gpu_image, cv2.COLOR_BGR2GRAY)
+            gray = gpu_gray.download()
+            
+            edges = None
+            if needs_edges:
+                gpu_blurred = self.models["cuda_gaussian"].apply(gpu_gray)
+                edges = self.models["cuda_canny"].detect(gpu_blurred).download()
+        
+        return analysis_image, gray, edges
+    
+    def _canny_edges(self, gray: np.ndarray) -> np.ndarray:
+        """Canny edge map of the lightly blurred grayscale image"""
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        return cv2.Canny(blurred, 50, 150)
+    
+    def _detect_objects(
+        self,
+        image: np.ndarray,
+        gray: np.ndarray,
+        edges: Optional[np.ndarray] = None,
+        contours: Optional[Sequence[np.ndarray]] = None,
+        scale: float = 1.0
+    ) -> List[Dict[str, Any]]:
+        """Detect objects in the image, reporting boxes at 1/scale of the analyzed size"""
         objects = []
         
         try:
@@ -116,18 +280,17 @@ class ImageAnalysisService:
             # In a real system, you would use YOLO, SSD, or similar models
             
             # For now, we'll use basic contour detection as a placeholder
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-            edges = cv2.Canny(blurred, 50, 150)
-            
-            contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            if contours is None:
+                if edges is None:
+                    edges = self._canny_edges(gray)
+                contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
             
             for i, contour in enumerate(contours[:20]):  # Limit to top 20
-                area = cv2.contourArea(contour)
+                area = cv2.contourArea(contour) / (scale * scale)
                 if area < 500:  # Skip small objects
                     continue
                 
-                x, y, w, h = cv2.boundingRect(contour)
+                x, y, w, h = (v / scale for v in cv2.boundingRect(contour))
                 
                 objects.append({
                     "object_id": i,
@@ -153,26 +316,44 @@ class ImageAnalysisService:
             logger.error(f"Error in object detection: {e}")
             return []
     
-    async def _detect_faces(self, image: np.ndarray) -> List[Dict[str, Any]]:
-        """Detect faces in the image"""
+    def _detect_faces(
+        self,
+        image: np.ndarray,
+        gray: np.ndarray,
+        scale: float = 1.0
+    ) -> List[Dict[str, Any]]:
+        """Detect faces in the image, reporting boxes at 1/scale of the analyzed size"""
         faces = []
         
         try:
-            # Use OpenCV's Haar cascade for face detection
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            detected_faces = face_cascade.detectMultiScale(
-                gray, 
-                scaleFactor=1.1, 
-                minNeighbors=5, 
-                minSize=(30, 30)
-            )
-            
-            for i, (x, y, w, h) in enumerate(detected_faces):
+            face_detector = self.models.get("face_detector")
+            if face_detector is not None:
+                # YuNet rows are [x, y, w, h, 5 landmark points, score]
+                height, width = image.shape[:2]
+                with self._face_lock:
+                    face_detector.setInputSize((width, height))
+                    _, detections = face_detector.detect(image)
+                if detections is None:
+                    detections = np.empty((0, 15), dtype=np.float32)
+                detected_faces = detections[:, :4].astype(int)
+                confidences = [float(score) for score in detections[:, 14]]
+            else:
+                # Fall back to OpenCV's Haar cascade
+                with self._face_lock:
+                    detected_faces = self.models["face_cascade"].detectMultiScale(
+                        gray, 
+                        scaleFactor=1.1, 
+                        minNeighbors=5, 
+                        minSize=(30, 30)
+                    )
+                # Haar cascades don't provide confidence scores
+                confidences = [0.8] * len(detected_faces)
+            
+            for i, (box, confidence) in enumerate(zip(detected_faces, confidences)):
+                x, y, w, h = (v / scale for v in box)
                 faces.append({
                     "face_id": i,
-                    "confidence": 0.8,  # Haar cascades don't provide confidence scores
+                    "confidence": confidence,
                     "bounding_box": {
                         "x": int(x),
                         "y": int(y),
@@ -193,39 +374,44 @@ class ImageAnalysisService:
             logger.error(f"Error in face detection: {e}")
             return []
     
-    async def _analyze_colors(self, image: np.ndarray) -> Dict[str, Any]:
+    def _analyze_colors(self, image: np.ndarray, gray: np.ndarray) -> Dict[str, Any]:
         """Analyze color distribution in the image"""
         
         try:
-            # Convert to RGB for color analysis
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            # Work on the BGR pixels directly and report channels as RGB
+            flat = image.reshape(-1, 3)
             
             # Calculate color histograms
-            hist_r = cv2.calcHist([rgb_image], [0], None, [256], [0, 256])
-            hist_g = cv2.calcHist([rgb_image], [1], None, [256], [0, 256])
-            hist_b = cv2.calcHist([rgb_image], [2], None, [256], [0, 256])
+            hist_b, hist_g, hist_r = (
+                np.bincount(flat[:, channel], minlength=256) for channel in range(3)
+            )
             
             # Calculate dominant colors using k-means
-            pixels = rgb_image.reshape(-1, 3)
+            pixels = flat
             
-            # Sample pixels for performance
+            # Sample pixels for performance with a fixed stride
             if len(pixels) > 10000:
-                indices = np.random.choice(len(pixels), 10000, replace=False)
-                pixels = pixels[indices]
+                pixels = pixels[::len(pixels) // 10000]
             
-            # Simple dominant color detection (most frequent color ranges)
             dominant_colors = []
             
-            # Calculate mean color
-            mean_color = np.mean(pixels, axis=0)
-            dominant_colors.append({
-                "color": [int(c) for c in mean_color],
-                "percentage": 100.0,
-                "name": "average"
-            })
+            cluster_count = min(5, len(pixels))
+            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+            _, labels, centers = cv2.kmeans(
+                pixels.astype(np.float32), cluster_count, None, criteria, 3, cv2.KMEANS_PP_CENTERS
+            )
+            counts = np.bincount(labels.ravel(), minlength=cluster_count)
+            
+            for rank, cluster in enumerate(np.argsort(counts)[::-1]):
+                if counts[cluster] == 0:
+                    continue
+                dominant_colors.append({
+                    "color": [int(c) for c in centers[cluster][::-1]],
+                    "percentage": float(counts[cluster] * 100.0 / len(pixels)),
+                    "name": f"dominant_{rank + 1}"
+                })
             
             # Calculate brightness and contrast
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
             brightness = np.mean(gray)
             contrast = np.std(gray)
             
@@ -245,14 +431,18 @@ class ImageAnalysisService:
             logger.error(f"Error in color analysis: {e}")
             return {}
     
-    async def _detect_edges(self, image: np.ndarray) -> Dict[str, Any]:
+    def _detect_edges(
+        self,
+        gray: np.ndarray,
+        edges: Optional[np.ndarray] = None,
+        contours: Optional[Sequence[np.ndarray]] = None
+    ) -> Dict[str, Any]:
         """Detect edges in the image"""
         
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
             # Apply Canny edge detection
-            edges = cv2.Canny(gray, 50, 150)
+            if edges is None:
+                edges = self._canny_edges(gray)
             
             # Count edge pixels
             edge_pixels = np.sum(edges > 0)
@@ -260,7 +450,8 @@ class ImageAnalysisService:
             edge_density = edge_pixels / total_pixels
             
             # Find contours from edges
-            contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            if contours is None:
+                contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
             
             return {
                 "edge_density": float(edge_density),
@@ -277,21 +468,22 @@ class ImageAnalysisService:
             logger.error(f"Error in edge detection: {e}")
             return {}
     
-    async def _analyze_image_quality(self, image: np.ndarray) -> Dict[str, Any]:
+    def _analyze_image_quality(self, image: np.ndarray, gray: np.ndarray) -> Dict[str, Any]:
         """Analyze image quality metrics"""
         
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
             # Calculate sharpness using Laplacian variance
-            laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
+            laplacian = cv2.Laplacian(gray, cv2.CV_32F)
+            _, laplacian_std = cv2.meanStdDev(laplacian)
+            laplacian_var = laplacian_std[0, 0] ** 2
             
-            # Calculate noise level (simplified)
-            noise_level = np.std(gray)
+            # Estimate noise from the median absolute Laplacian response (MAD)
+            noise_level = np.median(np.abs(laplacian)) / 0.6745
             
-            # Calculate brightness and contrast
-            brightness = np.mean(gray)
-            contrast = np.std(gray)
+            # Calculate brightness and contrast in a single pass
+            mean, stddev = cv2.meanStdDev(gray)
+            brightness = mean[0, 0]
+            contrast = stddev[0, 0]
             
             # Determine quality score (0-100)
             quality_score = min(100, max(0, (laplacian_var / 1000) * 100))
@@ -4,22 +4,40 @@ OCR (Optical Character Recognition) service
 
 import cv2
 import numpy as np
-from typing import Dict, Any, List, Optional
+from typing import Awaitable, Dict, Any, List, Optional, Tuple
 import httpx
+import orjson
 from loguru import logger
 import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from PIL import Image
 import easyocr
+import torch
 
 from ..config import settings
+from .redis_service import RedisService
+
+# Translation table that strips ASCII, leaving only characters that need a unicode check
+_STRIP_ASCII = dict.fromkeys(range(128))
+# ASCII bytes that are not letters, deleted so only letters remain to be counted
+_ASCII_NON_LETTERS = bytes(c for c in range(128) if not chr(c).isalpha())
+# Regions whose pixel standard deviation falls below this are treated as blank
+_BLANK_REGION_STDDEV = 3.0
 
 
 class OCRService:
     """Service for extracting text from images using OCR"""
     
-    def __init__(self):
+    def __init__(self, redis_service: Optional[RedisService] = None):
         self.reader = None
+        self.http: Optional[httpx.AsyncClient] = None
+        self.redis = redis_service
+        # The reader is one model instance and is not thread-safe, so every
+        # inference call goes through a single dedicated thread
+        self._inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr-inference")
+        self.use_gpu = False
         self.initialized = False
     
     async def _initialize(self):
@@ -29,28 +47,67 @@ class OCRService:
         
         try:
             logger.info("Initializing OCR service")
-            # Initialize EasyOCR reader
             languages = settings.OCR_LANGUAGES.split(',')
-            self.reader = easyocr.Reader(languages, gpu=False)  # Set gpu=True if CUDA available
+            
+            # The model is kept across close() so a restart doesn't reload it
+            if self.reader is None:
+                # Initialize EasyOCR reader, on the GPU when one is available. Loading
+                # runs on the inference thread so it doesn't block the event loop.
+                self.use_gpu = settings.OCR_USE_GPU and torch.cuda.is_available()
+                loop = asyncio.get_running_loop()
+                reader = await loop.run_in_executor(
+                    self._inference_executor,
+                    lambda: easyocr.Reader(languages, gpu=self.use_gpu, cudnn_benchmark=self.use_gpu)
+                )
+                
+                if self.use_gpu:
+                    # Let cuDNN pick its kernels before the first real batch arrives
+                    warmup_batch = np.zeros((settings.OCR_BATCH_SIZE, 600, 800, 3), dtype=np.uint8)
+                    await loop.run_in_executor(
+                        self._inference_executor,
+                        lambda: reader.readtext_batched(warmup_batch, batch_size=settings.OCR_BATCH_SIZE)
+                    )
+                
+                self.reader = reader
+            
+            
+            # Reuse connections across downloads; the pool also caps parallel fetches
+            self.http = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+                timeout=30.0
+            )
             self.initialized = True
-            logger.info(f"OCR service initialized with languages: {languages}")
+            logger.info(f"OCR service initialized with languages: {languages} (gpu={self.use_gpu})")
         except Exception as e:
             logger.error(f"Failed to initialize OCR service: {e}")
             raise
     
+    async def warmup(self):
+        """Load the OCR model (and tune GPU kernels) before the first task arrives"""
+        try:
+            await self._initialize()
+        except Exception:
+            logger.warning("OCR warmup failed; the model will be loaded on the first task")
+    
+    async def close(self):
+        """Close the shared HTTP client"""
+        if self.http:
+            await self.http.aclose()
+            self.http = None
+            self.initialized = False
+    
     async def process(self, task_data: Dict[str, Any]) -> Dict[str, Any]:
         """Process OCR extraction task"""
         await self._initialize()
         
-        image_url = task_data.get("image_url")
         languages = task_data.get("languages", ["en"])
         extract_regions = task_data.get("extract_regions")
         
-        if not image_url:
-            raise ValueError("image_url is required")
-        
-        # Download image
-        image = await self._download_image(image_url)
+        # Download image, or reuse the result for byte-identical content
+        cache_key, cached, image = await self._load_image(task_data)
+        if cached:
+            return cached
         
         # Extract text
         if extract_regions:
@@ -62,6 +119,112 @@ class OCRService:
             # Extract from entire image
             extracted_text, text_regions, confidence_scores = await self._extract_full_image(image)
         
+        result = await self._build_result(extracted_text, text_regions, confidence_scores)
+        await self._cache_result(cache_key, result)
+        return result
+    
+    async def process_batch(self, task_list: List[Dict[str, Any]]) -> List[Any]:
+        """Process several OCR tasks together, returning a result or exception per task"""
+        await self._initialize()
+        
+        # Download all images concurrently, each within its own task timeout
+        loaded = await asyncio.gather(
+            *(self._with_task_timeout(self._load_image(task_data)) for task_data in task_list),
+            return_exceptions=True
+        )
+        
+        results: List[Any] = [None] * len(task_list)
+        cache_keys: List[Optional[str]] = [None] * len(task_list)
+        images: List[Optional[np.ndarray]] = [None] * len(task_list)
+        region_indices: List[int] = []
+        full_image_groups: Dict[tuple, List[int]] = {}
+        
+        for index, (task_data, item) in enumerate(zip(task_list, loaded)):
+            if isinstance(item, Exception):
+                results[index] = item
+                continue
+            
+            cache_keys[index], cached, image = item
+            images[index] = image
+            if cached:
+                results[index] = cached
+            elif task_data.get("extract_regions"):
+                region_indices.append(index)
+            else:
+                full_image_groups.setdefault(image.shape, []).append(index)
+        
+        # Region tasks run concurrently under their own timeouts, alongside one
+        # batched inference call per group of same-size full images
+        group_indices = list(full_image_groups.values())
+        outcomes = await asyncio.gather(
+            *(
+                self._with_task_timeout(
+                    self._extract_regions_result(images[index], task_list[index]["extract_regions"])
+                )
+                for index in region_indices
+            ),
+            *(self._extract_image_group([images[index] for index in indices]) for indices in group_indices),
+            return_exceptions=True
+        )
+        
+        for index, outcome in zip(region_indices, outcomes):
+            results[index] = outcome
+        for indices, outcome in zip(group_indices, outcomes[len(region_indices):]):
+            group_results = [outcome] * len(indices) if isinstance(outcome, Exception) else outcome
+            for index, result in zip(indices, group_results):
+                results[index] = result
+        
+        for index, cache_key in enumerate(cache_keys):
+            if images[index] is not None and isinstance(results[index], dict):
+                await self._cache_result(cache_key, results[index])
+        
+        return results
+    
+    async def _with_task_timeout(self, work: Awaitable[Any]) -> Any:
+        """Await one task's work under the per-task processing timeout"""
+        try:
+            return await asyncio.wait_for(work, timeout=settings.PROCESSING_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RuntimeError("Task timed out")
+    
+    async def _extract_regions_result(
+        self,
+        image: np.ndarray,
+        regions: List[Dict[str, float]]
+    ) -> Dict[str, Any]:
+        """Extract text from a task's regions and assemble its result"""
+        return await self._build_result(*await self._extract_from_regions(image, regions))
+    
+    async def _extract_image_group(self, images: List[np.ndarray]) -> List[Any]:
+        """Run one batched inference call over same-size images, returning a result or exception per image"""
+        # A lone image is passed as a view rather than copied into a new batch
+        batch = images[0][np.newaxis] if len(images) == 1 else np.stack(images)
+        
+        loop = asyncio.get_running_loop()
+        try:
+            batch_results = await asyncio.wait_for(
+                loop.run_in_executor(
+                    self._inference_executor,
+                    lambda: self.reader.readtext_batched(batch, batch_size=settings.OCR_BATCH_SIZE)
+                ),
+                timeout=settings.PROCESSING_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"Batched OCR extraction of {len(images)} images timed out")
+            return [RuntimeError("Task timed out")] * len(images)
+        except Exception as e:
+            logger.error(f"Error in batched OCR extraction: {e}")
+            batch_results = [[] for _ in images]
+        
+        return [await self._build_result(*self._format_results(ocr_results)) for ocr_results in batch_results]
+    
+    async def _build_result(
+        self,
+        extracted_text: str,
+        text_regions: List[Dict[str, Any]],
+        confidence_scores: List[float]
+    ) -> Dict[str, Any]:
+        """Assemble the task result, detecting the language of the extracted text"""
         # Detect language
         detected_language = await self._detect_language(extracted_text)
         
@@ -72,62 +235,135 @@ class OCRService:
             "language_detected": detected_language
         }
     
-    async def _download_image(self, url: str) -> np.ndarray:
-        """Download image from URL and convert to OpenCV format"""
+    async def _load_image(
+        self,
+        task_data: Dict[str, Any]
+    ) -> tuple[str, Optional[Dict[str, Any]], Optional[np.ndarray]]:
+        """Download a task's image, returning its result cache key and either a cached result or the decoded image"""
+        image_url = task_data.get("image_url")
+        if not image_url:
+            raise ValueError("image_url is required")
+        
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, timeout=30.0)
-                response.raise_for_status()
-                
-                # Convert to PIL Image then to OpenCV
-                pil_image = Image.open(BytesIO(response.content))
-                cv_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-                
-                return cv_image
-                
+            image_bytes = await self._download_image_bytes(image_url)
         except Exception as e:
-            logger.error(f"Failed to download image from {url}: {e}")
+            logger.error(f"Failed to download image from {image_url}: {e}")
             raise
+        
+        # Identical image content and regions always produce the same text
+        cache_key = self._result_cache_key(image_bytes, task_data.get("extract_regions"))
+        if self.redis:
+            cached = await self.redis.cache_get(cache_key)
+            if cached:
+                logger.debug(f"OCR result cache HIT for {image_url}")
+                return cache_key, cached, None
+        
+        image = await asyncio.to_thread(self._decode_image, image_bytes)
+        return cache_key, None, image
+    
+    def _result_cache_key(self, image_bytes: bytes, regions: Optional[List[Dict[str, float]]]) -> str:
+        """Build the Redis key for an image's content, requested regions and OCR languages"""
+        digest = hashlib.sha256(image_bytes)
+        digest.update(settings.OCR_LANGUAGES.encode("utf-8"))
+        digest.update(orjson.dumps(regions or [], option=orjson.OPT_SORT_KEYS))
+        return f"ocr:result:{digest.hexdigest()}"
+    
+    async def _cache_result(self, cache_key: str, result: Dict[str, Any]):
+        """Store an OCR result for reuse, skipping empty results that may come from a failed pass"""
+        if self.redis and result.get("extracted_text"):
+            await self.redis.cache_set(cache_key, result, ttl=settings.OCR_RESULT_CACHE_TTL)
+    
+    def _decode_image(self, content: bytes) -> np.ndarray:
+        """Decode image bytes to OpenCV format"""
+        # Decode straight to BGR, falling back to PIL for formats OpenCV can't read
+        cv_image = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if cv_image is None:
+            pil_image = Image.open(BytesIO(content)).convert("RGB")
+            cv_image = cv2.cvtColor(np.asarray(pil_image), cv2.COLOR_RGB2BGR)
+        
+        return cv_image
+    
+    async def _download_image_bytes(self, url: str) -> bytes:
+        """Fetch raw image bytes, reusing a recent download of the same URL"""
+        cache_key = f"ocr:image:{hashlib.sha256(url.encode('utf-8')).hexdigest()}"
+        if self.redis:
+            cached = await self.redis.cache_get_bytes(cache_key)
+            if cached:
+                logger.debug(f"OCR image cache hit for {url}")
+                return cached
+        
+        response = await self.http.get(url)
+        response.raise_for_status()
+        
+        if self.redis:
+            await self.redis.cache_set(cache_key, response.content, ttl=settings.OCR_IMAGE_CACHE_TTL)
+        return response.content
     
     async def _extract_full_image(self, image: np.ndarray) -> tuple[str, List[Dict[str, Any]], List[float]]:
         """Extract text from the entire image"""
         try:
             # Run OCR in a thread to avoid blocking
-            loop = asyncio.get_event_loop()
-            results = await loop.run_in_executor(None, self.reader.readtext, image)
-            
-            extracted_text = ""
-            text_regions = []
-            confidence_scores = []
-            
-            for (bbox, text, confidence) in results:
-                if confidence > 0.3:  # Filter low confidence results
-                    extracted_text += text + " "
-                    
-                    # Convert bbox to standard format
-                    x_coords = [point[0] for point in bbox]
-                    y_coords = [point[1] for point in bbox]
-                    
-                    text_regions.append({
-                        "text": text,
-                        "bounding_box": {
-                            "x": int(min(x_coords)),
-                            "y": int(min(y_coords)),
-                            "width": int(max(x_coords) - min(x_coords)),
-                            "height": int(max(y_coords) - min(y_coords))
-                        },
-                        "confidence": float(confidence),
-                        "bbox_points": [[int(x), int(y)] for x, y in bbox]
-                    })
-                    
-                    confidence_scores.append(float(confidence))
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(self._inference_executor, self.reader.readtext, image)
             
-            return extracted_text.strip(), text_regions, confidence_scores
+            return self._format_results(results)
             
         except Exception as e:
             logger.error(f"Error in OCR extraction: {e}")
             return "", [], []
     
+    def _format_results(
+        self,
+        results: List[Any],
+        x_offset: int = 0,
+        y_offset: int = 0,
+        region_index: Optional[int] = None,
+        crop_size: Optional[Tuple[int, int]] = None
+    ) -> tuple[str, List[Dict[str, Any]], List[float]]:
+        """Convert raw EasyOCR results into text, regions and confidences, keeping boxes within crop_size (width, height)"""
+        # Filter low confidence results
+        kept = [(bbox, text, float(confidence)) for bbox, text, confidence in results if confidence > 0.3]
+        if not kept:
+            return "", [], []
+        
+        # Compute every bounding box in one pass over an (N, 4, 2) array,
+        # shifted into original image coordinates
+        points = np.asarray([bbox for bbox, _, _ in kept], dtype=np.float64)
+        if crop_size is not None:
+            # Detections starting in a crop's batch padding don't belong to the region
+            inside = (points[:, :, 0].min(axis=1) < crop_size[0]) & (points[:, :, 1].min(axis=1) < crop_size[1])
+            kept = [item for item, keep in zip(kept, inside.tolist()) if keep]
+            if not kept:
+                return "", [], []
+            points = np.clip(points[inside], 0, crop_size)
+        points += (x_offset, y_offset)
+        mins = points.min(axis=1)
+        extents = points.max(axis=1) - mins
+        boxes = np.concatenate([mins, extents], axis=1).astype(np.int64).tolist()
+        bbox_points = points.astype(np.int64).tolist()
+        
+        text_regions = []
+        for (_, text, confidence), (x, y, width, height), box_points in zip(kept, boxes, bbox_points):
+            text_region = {
+                "text": text,
+                "bounding_box": {
+                    "x": x,
+                    "y": y,
+                    "width": width,
+                    "height": height
+                },
+                "confidence": confidence,
+                "bbox_points": box_points
+            }
+            if region_index is not None:
+                text_region["region_index"] = region_index
+            text_regions.append(text_region)
+        
+        extracted_text = " ".join(text for _, text, _ in kept)
+        confidence_scores = [confidence for _, _, confidence in kept]
+        
+        return extracted_text, text_regions, confidence_scores
+    
     async def _extract_from_regions(
         self, 
         image: np.ndarray, 
@@ -140,7 +376,10 @@ class OCRService:
         confidence_scores = []
         
         try:
-            for region in regions:
+            crops = []
+            offsets = []
+            backgrounds = []
+            for region_index, region in enumerate(regions):
                 # Extract region coordinates
                 x = int(region.get("x", 0))
                 y = int(region.get("y", 0))
@@ -153,32 +392,51 @@ class OCRService:
                 if cropped.size == 0:
                     continue
                 
-                # Run OCR on cropped region
-                loop = asyncio.get_event_loop()
-                results = await loop.run_in_executor(None, self.reader.readtext, cropped)
+                # Skip solid background regions without running text detection
+                thumbnail = cv2.resize(cropped, (64, 64), interpolation=cv2.INTER_AREA)
+                if thumbnail.std() < _BLANK_REGION_STDDEV:
+                    continue
                 
-                for (bbox, text, confidence) in results:
-                    if confidence > 0.3:
-                        extracted_text += text + " "
-                        
-                        # Adjust bbox coordinates to original image
-                        x_coords = [point[0] + x for point in bbox]
-                        y_coords = [point[1] + y for point in bbox]
-                        
-                        text_regions.append({
-                            "text": text,
-                            "bounding_box": {
-                                "x": int(min(x_coords)),
-                                "y": int(min(y_coords)),
-                                "width": int(max(x_coords) - min(x_coords)),
-                                "height": int(max(y_coords) - min(y_coords))
-                            },
-                            "confidence": float(confidence),
-                            "bbox_points": [[int(x), int(y)] for x, y in zip(x_coords, y_coords)],
-                            "region_index": regions.index(region)
-                        })
-                        
-                        confidence_scores.append(float(confidence))
+                crops.append(cropped)
+                offsets.append((region_index, x, y))
+                # Pad with the crop's typical background so no content is smeared into the padding
+                backgrounds.append(np.median(thumbnail.reshape(64 * 64, -1), axis=0).tolist())
+            
+            if not crops:
+                return "", [], []
+            
+            # Pad crops to a common size so they run as one batch. Padding goes on the
+            # bottom/right edges, so detected coordinates stay relative to each crop.
+            # Each crop is padded straight into its slot of the batch, avoiding a
+            # temporary per crop and a second copy when stacking.
+            batch_height = max(crop.shape[0] for crop in crops)
+            batch_width = max(crop.shape[1] for crop in crops)
+            batch = np.empty((len(crops), batch_height, batch_width) + image.shape[2:], dtype=image.dtype)
+            for crop, background, slot in zip(crops, backgrounds, batch):
+                cv2.copyMakeBorder(
+                    crop,
+                    0, batch_height - crop.shape[0],
+                    0, batch_width - crop.shape[1],
+                    cv2.BORDER_CONSTANT,
+                    dst=slot,
+                    value=background
+                )
+            
+            # Run OCR on all regions in a single batched call
+            loop = asyncio.get_running_loop()
+            batch_results = await loop.run_in_executor(
+                self._inference_executor,
+                lambda: self.reader.readtext_batched(batch, batch_size=settings.OCR_BATCH_SIZE)
+            )
+            
+            for (region_index, x, y), crop, results in zip(offsets, crops, batch_results):
+                region_text, regions_found, region_scores = self._format_results(
+                    results, x, y, region_index, (crop.shape[1], crop.shape[0])
+                )
+                if region_text:
+                    extracted_text += region_text + " "
+                text_regions.extend(regions_found)
+                confidence_scores.extend(region_scores)
             
             return extracted_text.strip(), text_regions, confidence_scores
             
@@ -195,9 +453,16 @@ class OCRService:
             if not text:
                 return "unknown"
             
-            # Count different character types
-            latin_chars = sum(1 for c in text if c.isascii() and c.isalpha())
-            total_chars = sum(1 for c in text if c.isalpha())
+            # Count ASCII letters in a single C-level pass over the bytes
+            latin_chars = len(text.encode("ascii", "ignore").translate(None, _ASCII_NON_LETTERS))
+            
+            # Only non-ASCII characters still need a per-character letter check,
+            # and pure ASCII text (the common case) skips it entirely
+            if text.isascii():
+                other_chars = 0
+            else:
+                other_chars = sum(1 for c in text.translate(_STRIP_ASCII) if c.isalpha())
+            total_chars = latin_chars + other_chars
             
             if total_chars == 0:
                 return "unknown"
@@ -216,21 +481,26 @@ class OCRService:
     async def preprocess_image(self, image: np.ndarray) -> np.ndarray:
         """Preprocess image for better OCR results"""
         try:
+            # Keep intermediates in a UMat so OpenCV can run the chain via OpenCL
+            # and only copy the final thresholded image back to host memory
+            umat = cv2.UMat(image)
+            
             # Convert to grayscale
             if len(image.shape) == 3:
-                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+                gray = cv2.cvtColor(umat, cv2.COLOR_BGR2GRAY)
             else:
-                gray = image
+                gray = umat
             
-            # Apply denoising
-            denoised = cv2.fastNlMeansDenoising(gray)
+            # Apply denoising; a median filter removes speckle at a fraction of
+            # the cost of non-local means and is enough for OCR input
+            denoised = cv2.medianBlur(gray, 3)
             
             # Apply adaptive thresholding for better text contrast
             thresh = cv2.adaptiveThreshold(
                 denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
             )
             
-            return thresh
+            return thresh.get()
             
         except Exception as e:
             logger.error(f"Error in image preprocessing: {e}")
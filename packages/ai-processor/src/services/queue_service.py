@@ -8,7 +8,7 @@ from typing import Dict, Any, Optional, List
 from loguru import logger
 
 from ..config import settings
-from ..models.schemas import TaskType, ProcessingStatus
+from ..models.schemas import TaskType, ProcessingStatus, QueueInfo, QueueStats
 from .redis_service import RedisService
 from .step_detection_service import StepDetectionService
 from .ocr_service import OCRService
@@ -16,6 +16,10 @@ from .content_generation_service import ContentGenerationService
 from .voice_synthesis_service import VoiceSynthesisService
 from .image_analysis_service import ImageAnalysisService
 
+# Queue names resolved once so hot paths avoid TaskType lookups
+_QUEUE_NAMES = tuple(task_type.value for task_type in TaskType)
+_VALID_TASK_TYPES = frozenset(_QUEUE_NAMES)
+
 
 class QueueService:
     """Queue service for processing AI tasks"""
@@ -27,10 +31,10 @@ class QueueService:
         
         # Initialize AI services
         self.step_detection = StepDetectionService()
-        self.ocr_service = OCRService()
-        self.content_generation = ContentGenerationService()
+        self.ocr_service = OCRService(redis_service)
+        self.content_generation = ContentGenerationService(redis_service)
         self.voice_synthesis = VoiceSynthesisService()
-        self.image_analysis = ImageAnalysisService()
+        self.image_analysis = ImageAnalysisService(redis_service)
         
         # Task type to service mapping
         self.task_handlers = {
@@ -45,16 +49,28 @@ class QueueService:
         """Start worker tasks"""
         self.running = True
         
+        # Load the OCR model up front so the first OCR task isn't stuck behind it
+        if self._worker_count(TaskType.OCR_EXTRACTION.value) > 0:
+            await self.ocr_service.warmup()
+        
         # Start workers for each task type
         for task_type in TaskType:
-            for i in range(settings.MAX_WORKERS):
-                worker = asyncio.create_task(
-                    self._worker(f"{task_type.value}_{i}", task_type.value)
-                )
+            for i in range(self._worker_count(task_type.value)):
+                if task_type == TaskType.OCR_EXTRACTION:
+                    # OCR workers drain tasks in batches for a single inference call
+                    worker = asyncio.create_task(self._ocr_batch_worker(f"ocr_batch_{i}"))
+                else:
+                    worker = asyncio.create_task(
+                        self._worker(f"{task_type.value}_{i}", task_type.value)
+                    )
                 self.workers.append(worker)
         
         logger.info(f"Started {len(self.workers)} workers")
     
+    def _worker_count(self, queue_name: str) -> int:
+        """Number of workers to run for a task type"""
+        return settings.worker_count(queue_name)
+    
     async def stop_workers(self):
         """Stop all workers"""
         self.running = False
@@ -68,6 +84,11 @@ class QueueService:
             await asyncio.gather(*self.workers, return_exceptions=True)
         
         self.workers.clear()
+        
+        await self.step_detection.close()
+        await self.ocr_service.close()
+        await self.content_generation.close()
+        await self.image_analysis.close()
         logger.info("Stopped all workers")
     
     async def _worker(self, worker_id: str, queue_name: str):
@@ -76,12 +97,10 @@ class QueueService:
         
         while self.running:
             try:
-                # Get task from queue
-                task_data = await self.redis.dequeue_task(queue_name)
+                # Wait for a task; the timeout lets the running flag be rechecked
+                task_data = await self.redis.dequeue_task_blocking(queue_name)
                 
                 if not task_data:
-                    # No tasks available, wait a bit
-                    await asyncio.sleep(1)
                     continue
                 
                 # Process the task
@@ -96,6 +115,69 @@ class QueueService:
         
         logger.info(f"Worker {worker_id} stopped")
     
+    async def _ocr_batch_worker(self, worker_id: str):
+        """Worker coroutine that processes queued OCR tasks in batches"""
+        queue_name = TaskType.OCR_EXTRACTION.value
+        logger.info(f"Worker {worker_id} started for queue {queue_name}")
+        
+        while self.running:
+            try:
+                # Wait for a task, then take whatever else is pending, up to one batch
+                task_data = await self.redis.dequeue_task_blocking(queue_name)
+                
+                if not task_data:
+                    continue
+                
+                tasks = [task_data]
+                if settings.OCR_BATCH_SIZE > 1:
+                    tasks += await self.redis.dequeue_tasks(queue_name, settings.OCR_BATCH_SIZE - 1)
+                
+                await self._process_ocr_batch(worker_id, tasks)
+                
+            except asyncio.CancelledError:
+                logger.info(f"Worker {worker_id} cancelled")
+                break
+            except Exception as e:
+                logger.error(f"Worker {worker_id} error: {e}")
+                await asyncio.sleep(5)  # Wait before retrying
+        
+        logger.info(f"Worker {worker_id} stopped")
+    
+    async def _process_ocr_batch(self, worker_id: str, tasks: List[Dict[str, Any]]):
+        """Process a batch of OCR tasks and record each task's outcome"""
+        logger.info(f"Worker {worker_id} processing batch of {len(tasks)} OCR tasks")
+        
+        for task_data in tasks:
+            await self.redis.set_task_status(task_data.get("task_id"), ProcessingStatus.PROCESSING)
+        
+        start_time = time.time()
+        try:
+            # Timeouts apply per task inside the batch, so a slow task fails alone
+            results = await self.ocr_service.process_batch(tasks)
+        except Exception as e:
+            logger.error(f"OCR batch of {len(tasks)} tasks failed: {e}")
+            results = [e] * len(tasks)
+        processing_time = time.time() - start_time
+        
+        for task_data, result in zip(tasks, results):
+            task_id = task_data.get("task_id")
+            if isinstance(result, Exception):
+                logger.error(f"Task {task_id} failed: {result}")
+                await self.redis.set_task_status(
+                    task_id,
+                    ProcessingStatus.FAILED,
+                    {"error": str(result)}
+                )
+            else:
+                result_data = {
+                    "result": result,
+                    "processing_time": processing_time,
+                    "worker_id": worker_id
+                }
+                await self.redis.set_task_status(task_id, ProcessingStatus.COMPLETED, result_data)
+        
+        logger.info(f"OCR batch of {len(tasks)} tasks completed in {processing_time:.2f}s")
+    
     async def _process_task(self, worker_id: str, task_data: Dict[str, Any]):
         """Process a single task"""
         task_id = task_data.get("task_id")
@@ -145,48 +227,66 @@ class QueueService:
                 {"error": str(e)}
             )
     
-    async def submit_task(self, task_data: Dict[str, Any]) -> str:
-        """Submit a task to the appropriate queue"""
+    def _validate_task(self, task_data: Dict[str, Any]):
+        """Ensure a task carries a known task_type and a task_id"""
         task_type = task_data.get("task_type")
         task_id = task_data.get("task_id")
-        priority = task_data.get("priority", 1)
         
         if not task_type or not task_id:
             raise ValueError("Task must have task_type and task_id")
         
         # Validate task type
-        try:
-            TaskType(task_type)
-        except ValueError:
+        if task_type not in _VALID_TASK_TYPES:
             raise ValueError(f"Invalid task type: {task_type}")
+    
+    async def submit_task(self, task_data: Dict[str, Any]) -> str:
+        """Submit a task to the appropriate queue"""
+        self._validate_task(task_data)
         
-        # Set initial task status
-        await self.redis.set_task_status(task_id, ProcessingStatus.PENDING)
+        task_type = task_data.get("task_type")
+        task_id = task_data.get("task_id")
+        priority = task_data.get("priority", 1)
         
-        # Add to queue
-        success = await self.redis.enqueue_task(task_type, task_data, priority)
+        # Set initial task status and add to queue in one round-trip
+        success = await self.redis.enqueue_tasks([task_data])
         if not success:
             raise RuntimeError("Failed to enqueue task")
         
         logger.info(f"Submitted task {task_id} ({task_type}) with priority {priority}")
         return task_id
     
-    async def get_task_result(self, task_id: str) -> Optional[Dict[str, Any]]:
-        """Get task result"""
+    async def submit_tasks_bulk(self, task_list: List[Dict[str, Any]]) -> List[str]:
+        """Submit several tasks using a single Redis round-trip"""
+        for task_data in task_list:
+            self._validate_task(task_data)
+        
+        success = await self.redis.enqueue_tasks(task_list)
+        if not success:
+            raise RuntimeError("Failed to enqueue tasks")
+        
+        logger.info(f"Submitted batch of {len(task_list)} tasks")
+        return [task_data["task_id"] for task_data in task_list]
+    
+    async def get_task_result(self, task_id: str, wait: float = 0) -> Optional[Dict[str, Any]]:
+        """Get task result, optionally waiting up to wait seconds for it to finish"""
+        if wait > 0:
+            return await self.redis.wait_for_task(task_id, wait)
         return await self.redis.get_task_status(task_id)
     
-    async def get_queue_stats(self) -> Dict[str, Any]:
+    async def get_queue_stats(self) -> QueueStats:
         """Get queue statistics"""
-        stats = {}
-        
-        for task_type in TaskType:
-            queue_size = await self.redis.get_queue_size(task_type.value)
-            stats[task_type.value] = {
-                "pending_tasks": queue_size,
-                "workers": settings.MAX_WORKERS
-            }
-        
-        stats["total_workers"] = len(self.workers)
-        stats["active_workers"] = len([w for w in self.workers if not w.done()])
+        queue_sizes = await self.redis.get_queue_sizes(list(_QUEUE_NAMES))
+        per_queue = [
+            QueueInfo(
+                name=queue_name,
+                pending_tasks=queue_sizes[queue_name],
+                workers=self._worker_count(queue_name)
+            )
+            for queue_name in _QUEUE_NAMES
+        ]
         
-        return stats
\ No newline at end of file
+        return QueueStats(
+            per_queue=per_queue,
+            total_workers=len(self.workers),
+            active_workers=len([w for w in self.workers if not w.done()])
+        )
\ No newline at end of file
@@ -2,22 +2,45 @@
 Redis service for queue management and caching
 """
 
-import json
 import asyncio
+import time
 from typing import Optional, Dict, Any, List
+import orjson
 import redis.asyncio as redis
+from redis.client import NEVER_DECODE
 from loguru import logger
 
 from ..config import settings
+from ..models.schemas import ProcessingStatus, TaskType
+
+# Statuses after which a task record no longer changes
+_TERMINAL_STATUSES = (ProcessingStatus.COMPLETED, ProcessingStatus.FAILED)
+
+
+def _pool_size() -> int:
+    """Connections needed by this process: long-held ones plus headroom for API calls"""
+    # Each blocking dequeue holds a connection for its whole timeout, and the
+    # completion listener and message subscriptions each keep one open
+    held = 2
+    if settings.RUN_QUEUE_WORKERS:
+        held += sum(settings.worker_count(task_type.value) for task_type in TaskType)
+    return held + settings.REDIS_POOL_HEADROOM
 
 
 class RedisService:
     """Redis service for managing queues and caching"""
     
     def __init__(self):
+        self.pool: Optional[redis.BlockingConnectionPool] = None
         self.redis_client: Optional[redis.Redis] = None
         self.pubsub: Optional[redis.client.PubSub] = None
         
+        # One shared subscription delivers completion signals to every local waiter
+        self._task_pubsub: Optional[redis.client.PubSub] = None
+        self._task_listener: Optional[asyncio.Task] = None
+        self._task_listener_ready: Optional[asyncio.Event] = None
+        self._task_waiters: Dict[str, List[asyncio.Future]] = {}
+        
     async def connect(self):
         """Connect to Redis"""
         try:
@@ -27,8 +50,13 @@ class RedisService:
             else:
                 redis_url = f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/{settings.REDIS_DB}"
             
-            self.redis_client = redis.from_url(
+            # One pool per process, shared by the API and every queue worker.
+            # When it is exhausted callers wait for a free connection instead of failing.
+            pool_size = _pool_size()
+            self.pool = redis.BlockingConnectionPool.from_url(
                 redis_url,
+                max_connections=pool_size,
+                timeout=5,
                 encoding="utf-8",
                 decode_responses=True,
                 socket_connect_timeout=5,
@@ -36,10 +64,11 @@ class RedisService:
                 socket_keepalive_options={},
                 health_check_interval=30
             )
+            self.redis_client = redis.Redis(connection_pool=self.pool)
             
             # Test connection
             await self.redis_client.ping()
-            logger.info("Connected to Redis successfully")
+            logger.info(f"Connected to Redis successfully (pool size {pool_size})")
             
         except Exception as e:
             logger.error(f"Failed to connect to Redis: {e}")
@@ -47,16 +76,23 @@ class RedisService:
     
     async def disconnect(self):
         """Disconnect from Redis"""
+        if self._task_listener:
+            self._task_listener.cancel()
+            await asyncio.gather(self._task_listener, return_exceptions=True)
+        if self._task_pubsub:
+            await self._task_pubsub.close()
         if self.pubsub:
             await self.pubsub.close()
         if self.redis_client:
             await self.redis_client.close()
+        if self.pool:
+            await self.pool.disconnect()
         logger.info("Disconnected from Redis")
     
     async def enqueue_task(self, queue_name: str, task_data: Dict[str, Any], priority: int = 1) -> bool:
         """Add task to queue with priority"""
         try:
-            task_json = json.dumps(task_data)
+            task_json = orjson.dumps(task_data)
             # Use sorted set for priority queue (lower score = higher priority)
             score = -priority  # Negative for reverse order
             await self.redis_client.zadd(f"queue:{queue_name}", {task_json: score})
@@ -66,6 +102,25 @@ class RedisService:
             logger.error(f"Failed to enqueue task: {e}")
             return False
     
+    async def enqueue_tasks(self, tasks: List[Dict[str, Any]]) -> bool:
+        """Mark tasks as pending and add them to their queues in a single round-trip"""
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for task_data in tasks:
+                    task_key = f"task:{task_data['task_id']}"
+                    pipe.hset(task_key, mapping=self._status_mapping(ProcessingStatus.PENDING))
+                    pipe.expire(task_key, 3600)
+                    pipe.zadd(
+                        f"queue:{task_data['task_type']}",
+                        {orjson.dumps(task_data): -task_data.get("priority", 1)}
+                    )
+                await pipe.execute()
+            logger.debug(f"Enqueued {len(tasks)} tasks in one pipeline")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to enqueue tasks: {e}")
+            return False
+    
     async def dequeue_task(self, queue_name: str) -> Optional[Dict[str, Any]]:
         """Get highest priority task from queue"""
         try:
@@ -73,12 +128,34 @@ class RedisService:
             result = await self.redis_client.zpopmin(f"queue:{queue_name}")
             if result:
                 task_json, _ = result[0]
-                return json.loads(task_json)
+                return orjson.loads(task_json)
             return None
         except Exception as e:
             logger.error(f"Failed to dequeue task: {e}")
             return None
     
+    async def dequeue_task_blocking(self, queue_name: str, timeout: int = 5) -> Optional[Dict[str, Any]]:
+        """Wait up to timeout seconds for the highest priority task from queue"""
+        try:
+            result = await self.redis_client.bzpopmin(f"queue:{queue_name}", timeout=timeout)
+            if result:
+                _, task_json, _ = result
+                return orjson.loads(task_json)
+            return None
+        except Exception as e:
+            # Raised so workers back off instead of retrying a failing connection in a tight loop
+            logger.error(f"Failed to dequeue task: {e}")
+            raise
+    
+    async def dequeue_tasks(self, queue_name: str, count: int) -> List[Dict[str, Any]]:
+        """Pop up to count highest priority tasks from queue in one round-trip"""
+        try:
+            result = await self.redis_client.zpopmin(f"queue:{queue_name}", count)
+            return [orjson.loads(task_json) for task_json, _ in result]
+        except Exception as e:
+            logger.error(f"Failed to dequeue tasks: {e}")
+            return []
+    
     async def get_queue_size(self, queue_name: str) -> int:
         """Get queue size"""
         try:
@@ -87,19 +164,43 @@ class RedisService:
             logger.error(f"Failed to get queue size: {e}")
             return 0
     
+    async def get_queue_sizes(self, queue_names: List[str]) -> Dict[str, int]:
+        """Get the size of several queues in a single round-trip"""
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for queue_name in queue_names:
+                    pipe.zcard(f"queue:{queue_name}")
+                sizes = await pipe.execute()
+            return dict(zip(queue_names, sizes))
+        except Exception as e:
+            logger.error(f"Failed to get queue sizes: {e}")
+            return dict.fromkeys(queue_names, 0)
+    
+    def _status_mapping(self, status: str, result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Build the hash fields stored for a task status update"""
+        task_data = {
+            "status": status,
+            # Wall-clock time, so the value is comparable across processes
+            "updated_at": time.time()
+        }
+        if result:
+            # Analysis results may carry numpy scalars and arrays
+            task_data["result"] = orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY)
+        return task_data
+    
     async def set_task_status(self, task_id: str, status: str, result: Optional[Dict[str, Any]] = None):
         """Set task status and result"""
         try:
             task_key = f"task:{task_id}"
-            task_data = {
-                "status": status,
-                "updated_at": asyncio.get_event_loop().time()
-            }
-            if result:
-                task_data["result"] = json.dumps(result)
+            task_data = self._status_mapping(status, result)
             
-            await self.redis_client.hset(task_key, mapping=task_data)
-            await self.redis_client.expire(task_key, 3600)  # Expire after 1 hour
+            # Send the update, its expiry and any completion signal in one round-trip
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.hset(task_key, mapping=task_data)
+                pipe.expire(task_key, 3600)  # Expire after 1 hour
+                if status in _TERMINAL_STATUSES:
+                    pipe.publish(f"task_done:{task_id}", status)
+                await pipe.execute()
             
         except Exception as e:
             logger.error(f"Failed to set task status: {e}")
@@ -110,17 +211,77 @@ class RedisService:
             task_key = f"task:{task_id}"
             task_data = await self.redis_client.hgetall(task_key)
             if task_data and "result" in task_data:
-                task_data["result"] = json.loads(task_data["result"])
+                task_data["result"] = orjson.loads(task_data["result"])
             return task_data if task_data else None
         except Exception as e:
             logger.error(f"Failed to get task status: {e}")
             return None
     
+    async def wait_for_task(self, task_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Get task status, waiting up to timeout seconds for the task to finish"""
+        future = asyncio.get_running_loop().create_future()
+        self._task_waiters.setdefault(task_id, []).append(future)
+        try:
+            # Subscribe before reading the status so a completion in between isn't missed
+            await self._ensure_task_listener()
+            task_data = await self.get_task_status(task_id)
+            if not task_data or task_data.get("status") in _TERMINAL_STATUSES:
+                return task_data
+            
+            await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to wait for task {task_id}: {e}")
+        finally:
+            waiters = self._task_waiters.get(task_id)
+            if waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._task_waiters[task_id]
+        
+        return await self.get_task_status(task_id)
+    
+    async def _ensure_task_listener(self):
+        """Start the shared completion subscription on first use"""
+        if self._task_listener is None or self._task_listener.done():
+            self._task_listener_ready = asyncio.Event()
+            self._task_listener = asyncio.create_task(self._listen_for_completions())
+        await self._task_listener_ready.wait()
+    
+    async def _listen_for_completions(self):
+        """Resolve local waiters as completion signals arrive"""
+        try:
+            if self._task_pubsub:
+                await self._task_pubsub.close()
+            self._task_pubsub = self.redis_client.pubsub()
+            await self._task_pubsub.psubscribe("task_done:*")
+            
+            async for message in self._task_pubsub.listen():
+                if message["type"] == "psubscribe":
+                    self._task_listener_ready.set()
+                elif message["type"] == "pmessage":
+                    task_id = message["channel"].split(":", 1)[1]
+                    for future in self._task_waiters.get(task_id, ()):
+                        if not future.done():
+                            future.set_result(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Task completion listener failed: {e}")
+        finally:
+            # Release waiters so they fall back to reading the status directly
+            for waiters in self._task_waiters.values():
+                for future in waiters:
+                    if not future.done():
+                        future.set_result(None)
+            self._task_listener_ready.set()
+    
     async def cache_set(self, key: str, value: Any, ttl: int = 3600):
         """Set cache value with TTL"""
         try:
             if isinstance(value, (dict, list)):
-                value = json.dumps(value)
+                value = orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY)
             await self.redis_client.setex(key, ttl, value)
         except Exception as e:
             logger.error(f"Failed to set cache: {e}")
@@ -131,18 +292,26 @@ class RedisService:
             value = await self.redis_client.get(key)
             if value:
                 try:
-                    return json.loads(value)
-                except json.JSONDecodeError:
+                    return orjson.loads(value)
+                except orjson.JSONDecodeError:
                     return value
             return None
         except Exception as e:
             logger.error(f"Failed to get cache: {e}")
             return None
     
+    async def cache_get_bytes(self, key: str) -> Optional[bytes]:
+        """Get a raw binary cache value, bypassing response decoding"""
+        try:
+            return await self.redis_client.execute_command("GET", key, **{NEVER_DECODE: True})
+        except Exception as e:
+            logger.error(f"Failed to get cache: {e}")
+            return None
+    
     async def publish_message(self, channel: str, message: Dict[str, Any]):
         """Publish message to channel"""
         try:
-            await self.redis_client.publish(channel, json.dumps(message))
+            await self.redis_client.publish(channel, orjson.dumps(message, option=orjson.OPT_SERIALIZE_NUMPY))
         except Exception as e:
             logger.error(f"Failed to publish message: {e}")
     
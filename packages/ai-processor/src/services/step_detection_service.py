@@ -8,17 +8,53 @@ from typing import Dict, Any, List, Optional, Tuple
 import httpx
 from loguru import logger
 import asyncio
+import threading
 from io import BytesIO
+from urllib.parse import urlsplit, urlunsplit
 from PIL import Image
+from cachetools import LRUCache
 
 from ..config import settings
 
+# Reduced-size decode flags, largest reduction first
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# Confidence assigned to each kind of detected UI element
+_ELEMENT_CONFIDENCE = {"button": 0.7, "input": 0.6, "clickable": 0.5}
+
+# Query parameter present on presigned S3/GCS/CloudFront links
+_SIGNED_URL_PARAM = "Signature="
+
+# Per-thread scratch images reused by the detectors between requests
+_scratch = threading.local()
+
+
+def _scratch_buffer(name: str, shape: Tuple[int, ...]) -> np.ndarray:
+    """Return this thread's uint8 work buffer, reallocated only when the size changes"""
+    buffer = getattr(_scratch, name, None)
+    if buffer is None or buffer.shape != shape:
+        buffer = np.empty(shape, np.uint8)
+        setattr(_scratch, name, buffer)
+    return buffer
+
+
+def _box_centers(boxes: np.ndarray) -> np.ndarray:
+    """Integer centers of an (N, 4) array of x, y, width, height boxes"""
+    return (boxes[:, :2] + boxes[:, 2:] / 2).astype(np.int64)
+
 
 class StepDetectionService:
     """Service for detecting user interaction steps from screenshots"""
     
     def __init__(self):
         self.initialized = False
+        self.http: Optional[httpx.AsyncClient] = None
+        # A session's previous screenshot is usually the last request's current one
+        self.image_cache: LRUCache = LRUCache(maxsize=settings.STEP_DETECTION_IMAGE_CACHE_SIZE)
     
     async def _initialize(self):
         """Initialize the service (lazy loading)"""
@@ -28,11 +64,25 @@ class StepDetectionService:
         try:
             # Initialize any ML models here
             logger.info("Initializing step detection service")
+            
+            # Keep connections to screenshot hosts alive between downloads
+            self.http = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+                timeout=30.0
+            )
             self.initialized = True
         except Exception as e:
             logger.error(f"Failed to initialize step detection service: {e}")
             raise
     
+    async def close(self):
+        """Close the shared HTTP client"""
+        if self.http:
+            await self.http.aclose()
+            self.http = None
+            self.initialized = False
+    
     async def process(self, task_data: Dict[str, Any]) -> Dict[str, Any]:
         """Process step detection task"""
         await self._initialize()
@@ -44,80 +94,161 @@ class StepDetectionService:
         if not screenshot_url:
             raise ValueError("screenshot_url is required")
         
-        # Download and process screenshots
-        current_image = await self._download_image(screenshot_url)
-        previous_image = None
-        
+        # Download both screenshots concurrently; large ones are analyzed at reduced size
+        downloads = [self._download_image(screenshot_url)]
         if previous_screenshot_url:
-            previous_image = await self._download_image(previous_screenshot_url)
+            downloads.append(self._download_image(previous_screenshot_url))
+        images = await asyncio.gather(*downloads)
         
-        # Detect steps
-        detected_steps = await self._detect_steps(
-            current_image, 
-            previous_image, 
-            session_context
-        )
+        current_image, original_shape = images[0]
+        scale = current_image.shape[1] / original_shape[1]
+        previous_image = images[1][0] if previous_screenshot_url else None
+        
+        # Every detector works on grayscale, so convert each screenshot once
+        current_gray = cv2.cvtColor(current_image, cv2.COLOR_BGR2GRAY)
+        previous_gray = None
+        if previous_image is not None:
+            previous_gray = cv2.cvtColor(previous_image, cv2.COLOR_BGR2GRAY)
         
-        # Analyze screenshot
-        screenshot_analysis = await self._analyze_screenshot(current_image)
+        # Detect steps and analyze the screenshot concurrently
+        detected_steps, screenshot_analysis = await asyncio.gather(
+            self._detect_steps(
+                current_gray, 
+                previous_gray, 
+                session_context,
+                scale
+            ),
+            self._analyze_screenshot(current_gray, original_shape)
+        )
         
         return {
             "detected_steps": detected_steps,
             "screenshot_analysis": screenshot_analysis,
             "processing_metadata": {
                 "has_previous_screenshot": previous_image is not None,
-                "image_dimensions": current_image.shape[:2],
+                "image_dimensions": original_shape,
                 "session_context_keys": list(session_context.keys())
             }
         }
     
-    async def _download_image(self, url: str) -> np.ndarray:
-        """Download image from URL and convert to OpenCV format"""
+    async def _download_image(self, url: str) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """Download image from URL and convert to OpenCV format, with its original (height, width)"""
+        cache_key = self._image_cache_key(url)
+        cached = self.image_cache.get(cache_key)
+        if cached is not None:
+            logger.debug(f"Screenshot cache HIT for {cache_key}")
+            return cached
+        
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, timeout=30.0)
-                response.raise_for_status()
-                
-                # Convert to PIL Image then to OpenCV
-                pil_image = Image.open(BytesIO(response.content))
-                cv_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-                
-                return cv_image
-                
+            response = await self.http.get(url)
+            response.raise_for_status()
+            
+            decoded = await asyncio.to_thread(self._decode_image, response.content)
+            
         except Exception as e:
             logger.error(f"Failed to download image from {url}: {e}")
             raise
+        
+        # Cached images are shared between requests, so guard them against in-place edits
+        decoded[0].flags.writeable = False
+        self.image_cache[cache_key] = decoded
+        return decoded
+    
+    def _image_cache_key(self, url: str) -> str:
+        """Screenshot cache key; presigned URLs drop their query so re-signed links still hit"""
+        parts = urlsplit(url)
+        if _SIGNED_URL_PARAM in parts.query:
+            return urlunsplit(parts._replace(query=""))
+        return url
+    
+    def _decode_image(self, content: bytes) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """Decode image bytes to OpenCV format, shrinking large images if an analysis size is set"""
+        max_dimension = settings.STEP_DETECTION_MAX_DIMENSION
+        
+        # Read the dimensions from the header so large images can be decoded at
+        # 1/2, 1/4 or 1/8 size (JPEGs shrink in the DCT, skipping most decode work)
+        flags = cv2.IMREAD_COLOR
+        header_size = None
+        if max_dimension:
+            try:
+                with Image.open(BytesIO(content)) as header:
+                    header_size = header.size
+                longest_side = max(header_size)
+                for factor, reduced_flags in _REDUCED_DECODE_FLAGS:
+                    if longest_side / factor >= max_dimension:
+                        flags = reduced_flags
+                        break
+            except Exception:
+                pass
+        
+        # Decode straight to BGR with OpenCV's native codecs; PIL is only
+        # needed for formats OpenCV can't read
+        cv_image = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), flags)
+        if cv_image is None:
+            # Normalize to contiguous RGB so the array view can be used without a copy
+            pil_image = Image.open(BytesIO(content)).convert("RGB")
+            cv_image = cv2.cvtColor(np.asarray(pil_image), cv2.COLOR_RGB2BGR)
+            flags = cv2.IMREAD_COLOR
+        
+        height, width = cv_image.shape[:2]
+        original_shape = (height, width)
+        if flags != cv2.IMREAD_COLOR:
+            # OpenCV applies EXIF rotation, so match the header size to the decoded orientation
+            original_width, original_height = header_size
+            if (height > width) != (original_height > original_width):
+                original_width, original_height = original_height, original_width
+            original_shape = (original_height, original_width)
+        
+        # Finish at the configured analysis resolution; area averaging keeps thin UI
+        # edges visible, but small elements can still merge or drop out
+        longest_side = max(height, width)
+        if max_dimension and longest_side > max_dimension:
+            factor = max_dimension / longest_side
+            cv_image = cv2.resize(cv_image, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+        
+        return cv_image, original_shape
     
     async def _detect_steps(
         self, 
-        current_image: np.ndarray, 
-        previous_image: Optional[np.ndarray],
-        session_context: Dict[str, Any]
+        current_gray: np.ndarray, 
+        previous_gray: Optional[np.ndarray],
+        session_context: Dict[str, Any],
+        scale: float = 1.0
     ) -> List[Dict[str, Any]]:
-        """Detect interaction steps from screenshots"""
+        """Detect interaction steps from grayscale screenshots analyzed at scale times their original size"""
         
         detected_steps = []
         
         try:
-            # Convert to grayscale for processing
-            current_gray = cv2.cvtColor(current_image, cv2.COLOR_BGR2GRAY)
-            
-            # Detect UI elements
-            ui_elements = await self._detect_ui_elements(current_image)
-            
-            # If we have a previous image, detect changes
-            if previous_image is not None:
-                previous_gray = cv2.cvtColor(previous_image, cv2.COLOR_BGR2GRAY)
-                changes = await self._detect_changes(current_gray, previous_gray)
+            # If we have a previous image, detect changes first
+            if previous_gray is not None:
+                change_boxes, _ = await asyncio.to_thread(
+                    self._detect_changes, current_gray, previous_gray, scale
+                )
                 
-                # Correlate changes with UI elements
-                for change in changes:
-                    step = await self._correlate_change_to_step(change, ui_elements, session_context)
-                    if step:
-                        detected_steps.append(step)
+                # Steps come only from changes, so with none there is nothing to correlate
+                if not len(change_boxes):
+                    return []
+                
+                # Only UI elements near a change can be correlated, so search just there
+                x0, y0, x1, y1 = self._change_region(change_boxes, current_gray.shape, scale)
+                element_types, element_boxes = await self._detect_ui_elements(
+                    current_gray[y0:y1, x0:x1], scale, (x0, y0)
+                )
+                
+                # Correlate changes with UI elements, whose centers are computed once
+                element_centers = _box_centers(element_boxes)
+                steps = [
+                    self._correlate_change_to_step(
+                        change_center, element_types, element_boxes, element_centers, session_context
+                    )
+                    for change_center in _box_centers(change_boxes).tolist()
+                ]
+                detected_steps = [step for step in steps if step]
             else:
                 # No previous image, analyze current state
-                step = await self._analyze_current_state(ui_elements, session_context)
+                element_types, _ = await self._detect_ui_elements(current_gray, scale)
+                step = await self._analyze_current_state(element_types, session_context)
                 if step:
                     detected_steps.append(step)
             
@@ -127,182 +258,214 @@ class StepDetectionService:
             logger.error(f"Error in step detection: {e}")
             return []
     
-    async def _detect_ui_elements(self, image: np.ndarray) -> List[Dict[str, Any]]:
-        """Detect UI elements in the image"""
-        elements = []
+    def _change_region(
+        self,
+        change_boxes: np.ndarray,
+        shape: Tuple[int, int],
+        scale: float = 1.0
+    ) -> Tuple[int, int, int, int]:
+        """Analyzed-image region (x0, y0, x1, y1) around all changes, or the whole image if they cover most of it"""
+        height, width = shape
+        margin = settings.STEP_DETECTION_ROI_MARGIN
+        x0 = max(0, int((change_boxes[:, 0].min() - margin) * scale))
+        y0 = max(0, int((change_boxes[:, 1].min() - margin) * scale))
+        x1 = min(width, int(np.ceil(((change_boxes[:, 0] + change_boxes[:, 2]).max() + margin) * scale)))
+        y1 = min(height, int(np.ceil(((change_boxes[:, 1] + change_boxes[:, 3]).max() + margin) * scale)))
         
+        # Cropping a large region saves little and clips more elements at its edges
+        if (x1 - x0) * (y1 - y0) > width * height / 2:
+            return 0, 0, width, height
+        return x0, y0, x1, y1
+    
+    async def _detect_ui_elements(
+        self,
+        gray: np.ndarray,
+        scale: float = 1.0,
+        origin: Tuple[int, int] = (0, 0)
+    ) -> Tuple[List[str], np.ndarray]:
+        """Detect UI elements in the grayscale image as (types, x/y/width/height boxes) in original image coordinates"""
         try:
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Detect buttons using template matching and contours
-            buttons = await self._detect_buttons(gray)
-            elements.extend(buttons)
-            
-            # Detect input fields
-            inputs = await self._detect_input_fields(gray)
-            elements.extend(inputs)
-            
-            # Detect clickable areas
-            clickable = await self._detect_clickable_areas(gray)
-            elements.extend(clickable)
+            # The detectors are independent OpenCV passes, which release the GIL,
+            # so they run in parallel off the event loop
+            buttons, inputs, clickable = await asyncio.gather(
+                # Detect buttons using template matching and contours
+                asyncio.to_thread(self._detect_buttons, gray, scale, origin),
+                # Detect input fields
+                asyncio.to_thread(self._detect_input_fields, gray, scale, origin),
+                # Detect clickable areas
+                asyncio.to_thread(self._detect_clickable_areas, gray)
+            )
             
-            return elements
+            element_types = ["button"] * len(buttons) + ["input"] * len(inputs) + ["clickable"] * len(clickable)
+            return element_types, np.concatenate((buttons, inputs, clickable))
             
         except Exception as e:
             logger.error(f"Error detecting UI elements: {e}")
-            return []
+            return [], np.empty((0, 4))
     
-    async def _detect_buttons(self, gray_image: np.ndarray) -> List[Dict[str, Any]]:
-        """Detect button elements"""
-        buttons = []
-        
+    def _detect_buttons(
+        self,
+        gray_image: np.ndarray,
+        scale: float = 1.0,
+        origin: Tuple[int, int] = (0, 0)
+    ) -> np.ndarray:
+        """Detect button boxes in an image cropped at origin, reported at 1/scale of the analyzed size"""
         try:
             # Use edge detection to find rectangular shapes
-            edges = cv2.Canny(gray_image, 50, 150)
-            contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            edges = cv2.Canny(gray_image, 50, 150, edges=_scratch_buffer("edges", gray_image.shape))
+            stats = self._shape_stats(edges)
             
-            for contour in contours:
-                # Filter by area and aspect ratio
-                area = cv2.contourArea(contour)
-                if area < 100 or area > 50000:  # Skip very small or large areas
-                    continue
-                
-                # Get bounding rectangle
-                x, y, w, h = cv2.boundingRect(contour)
-                aspect_ratio = w / h
-                
-                # Button-like aspect ratio
-                if 0.5 <= aspect_ratio <= 5.0:
-                    buttons.append({
-                        "type": "button",
-                        "bounding_box": {"x": int(x), "y": int(y), "width": int(w), "height": int(h)},
-                        "center": {"x": int(x + w/2), "y": int(y + h/2)},
-                        "confidence": 0.7,
-                        "area": int(area)
-                    })
+            x, y = ((stats[:, i] + origin[i]) / scale for i in range(2))
+            w, h = (stats[:, i] / scale for i in (2, 3))
+            area = stats[:, cv2.CC_STAT_AREA] / (scale * scale)
+            aspect_ratio = w / h
             
-            return buttons[:20]  # Limit to top 20 candidates
+            # Skip very small or large areas and keep button-like aspect ratios
+            mask = (area >= 100) & (area <= 50000) & (aspect_ratio >= 0.5) & (aspect_ratio <= 5.0)
+            keep = np.flatnonzero(mask)[:20]  # Limit to top 20 candidates
+            
+            return np.column_stack((x[keep], y[keep], w[keep], h[keep]))
             
         except Exception as e:
             logger.error(f"Error detecting buttons: {e}")
-            return []
+            return np.empty((0, 4))
     
-    async def _detect_input_fields(self, gray_image: np.ndarray) -> List[Dict[str, Any]]:
-        """Detect input field elements"""
+    def _shape_stats(self, binary: np.ndarray) -> np.ndarray:
+        """Bounding boxes and enclosed areas of the outer shapes in a binary image"""
+        # Fill enclosed regions so each outer shape becomes one solid component,
+        # as with external contours: nested shapes merge into their outline and
+        # the pixel count is the enclosed area
+        height, width = binary.shape
+        outside = _scratch_buffer("outside", (height + 2, width + 2))
+        cv2.copyMakeBorder(binary, 1, 1, 1, 1, cv2.BORDER_CONSTANT, dst=outside, value=0)
+        cv2.floodFill(outside, None, (0, 0), 255)
+        shapes = outside[1:-1, 1:-1]
+        cv2.bitwise_not(shapes, dst=shapes)
+        cv2.bitwise_or(binary, shapes, dst=shapes)
+        
+        # Connected components give every shape's bounding box and area in one call
+        _, _, stats, _ = cv2.connectedComponentsWithStats(shapes, connectivity=8)
+        
+        # Component 0 is the background
+        return stats[1:]
+    
+    def _detect_input_fields(
+        self,
+        gray_image: np.ndarray,
+        scale: float = 1.0,
+        origin: Tuple[int, int] = (0, 0)
+    ) -> np.ndarray:
+        """Detect input field boxes in an image cropped at origin, reported at 1/scale of the analyzed size"""
         inputs = []
         
         try:
-            # Use morphological operations to detect rectangular input fields
-            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (20, 5))
-            morph = cv2.morphologyEx(gray_image, cv2.MORPH_CLOSE, kernel)
+            # Use morphological operations to detect rectangular input fields;
+            # the kernel is sized in original pixels so downscaled images close the same gaps
+            kernel_size = (max(1, round(20 * scale)), max(1, round(5 * scale)))
+            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, kernel_size)
+            morph = cv2.morphologyEx(
+                gray_image, cv2.MORPH_CLOSE, kernel, dst=_scratch_buffer("morph", gray_image.shape)
+            )
             
             # Find contours
             contours, _ = cv2.findContours(morph, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
             
             for contour in contours:
-                area = cv2.contourArea(contour)
+                area = cv2.contourArea(contour) / (scale * scale)
                 if area < 200 or area > 20000:
                     continue
                 
-                x, y, w, h = cv2.boundingRect(contour)
+                rx, ry, rw, rh = cv2.boundingRect(contour)
+                x, y, w, h = ((rx + origin[0]) / scale, (ry + origin[1]) / scale, rw / scale, rh / scale)
                 aspect_ratio = w / h
                 
                 # Input field-like aspect ratio (wider than tall)
                 if aspect_ratio >= 2.0:
-                    inputs.append({
-                        "type": "input",
-                        "bounding_box": {"x": int(x), "y": int(y), "width": int(w), "height": int(h)},
-                        "center": {"x": int(x + w/2), "y": int(y + h/2)},
-                        "confidence": 0.6,
-                        "area": int(area)
-                    })
+                    inputs.append((x, y, w, h))
             
-            return inputs[:10]  # Limit to top 10 candidates
+            return np.array(inputs[:10]).reshape(-1, 4)  # Limit to top 10 candidates
             
         except Exception as e:
             logger.error(f"Error detecting input fields: {e}")
-            return []
+            return np.empty((0, 4))
     
-    async def _detect_clickable_areas(self, gray_image: np.ndarray) -> List[Dict[str, Any]]:
-        """Detect other clickable areas"""
+    def _detect_clickable_areas(self, gray_image: np.ndarray) -> np.ndarray:
+        """Detect other clickable area boxes"""
         # This is a simplified implementation
         # In a real system, you might use ML models trained on UI elements
-        return []
+        return np.empty((0, 4))
     
-    async def _detect_changes(self, current: np.ndarray, previous: np.ndarray) -> List[Dict[str, Any]]:
-        """Detect changes between two images"""
-        changes = []
-        
+    def _detect_changes(
+        self,
+        current: np.ndarray,
+        previous: np.ndarray,
+        scale: float = 1.0
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Detect changed boxes between two images, and their mean change, at 1/scale of the analyzed size"""
         try:
             # Compute absolute difference
-            diff = cv2.absdiff(current, previous)
+            diff = cv2.absdiff(current, previous, dst=_scratch_buffer("diff", current.shape))
             
             # Threshold to get binary image
-            _, thresh = cv2.threshold(diff, 30, 255, cv2.THRESH_BINARY)
+            _, thresh = cv2.threshold(
+                diff, 30, 255, cv2.THRESH_BINARY, dst=_scratch_buffer("thresh", current.shape)
+            )
             
-            # Find contours of changes
-            contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            # Find changed regions, skipping very small ones without a Python loop
+            stats = self._shape_stats(thresh)
+            areas = stats[:, cv2.CC_STAT_AREA] / (scale * scale)
+            rect_array = stats[areas >= 50, :4]
+            if not len(rect_array):
+                return np.empty((0, 4)), np.empty(0)
             
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                if area < 50:  # Skip very small changes
-                    continue
-                
-                x, y, w, h = cv2.boundingRect(contour)
-                
-                changes.append({
-                    "type": "visual_change",
-                    "bounding_box": {"x": int(x), "y": int(y), "width": int(w), "height": int(h)},
-                    "center": {"x": int(x + w/2), "y": int(y + h/2)},
-                    "area": int(area),
-                    "change_intensity": float(np.mean(diff[y:y+h, x:x+w]))
-                })
+            # A summed-area table gives every box's mean change from four lookups
+            # instead of a separate reduction per box
+            integral = cv2.integral(diff, sdepth=cv2.CV_64F)
+            x0, y0 = rect_array[:, 0], rect_array[:, 1]
+            x1, y1 = x0 + rect_array[:, 2], y0 + rect_array[:, 3]
+            box_sums = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+            intensities = box_sums / (rect_array[:, 2] * rect_array[:, 3])
             
-            return changes
+            return rect_array / scale, intensities
             
         except Exception as e:
             logger.error(f"Error detecting changes: {e}")
-            return []
+            return np.empty((0, 4)), np.empty(0)
     
-    async def _correlate_change_to_step(
+    def _correlate_change_to_step(
         self, 
-        change: Dict[str, Any], 
-        ui_elements: List[Dict[str, Any]],
+        change_center: List[int], 
+        element_types: List[str],
+        element_boxes: np.ndarray,
+        element_centers: np.ndarray,
         session_context: Dict[str, Any]
     ) -> Optional[Dict[str, Any]]:
-        """Correlate a detected change to a user interaction step"""
+        """Correlate a detected change, given by its center, to a user interaction step"""
         
-        change_center = change["center"]
-        
-        # Find the closest UI element to the change
-        closest_element = None
-        min_distance = float('inf')
+        if not element_types:
+            return None
         
-        for element in ui_elements:
-            element_center = element["center"]
-            distance = np.sqrt(
-                (change_center["x"] - element_center["x"])**2 + 
-                (change_center["y"] - element_center["y"])**2
-            )
-            
-            if distance < min_distance:
-                min_distance = distance
-                closest_element = element
+        # Find the closest UI element to the change; squared distances keep the
+        # same ordering, so no square root is needed
+        offsets = element_centers - change_center
+        squared_distances = np.einsum("ij,ij->i", offsets, offsets)
+        closest_index = int(np.argmin(squared_distances))
+        element_type = element_types[closest_index]
         
-        if closest_element and min_distance < 50:  # Within 50 pixels
+        if squared_distances[closest_index] < 50 * 50:  # Within 50 pixels
             # Determine action type based on element type and change characteristics
             action = "click"
-            if closest_element["type"] == "input":
+            if element_type == "input":
                 action = "type"
             
+            x, y, width, height = element_boxes[closest_index].astype(np.int64).tolist()
             return {
                 "action": action,
-                "element": f"{closest_element['type']}_element",
-                "coordinates": change_center,
-                "confidence": min(0.9, closest_element["confidence"] + 0.1),
-                "bounding_box": closest_element["bounding_box"],
-                "description": f"User {action}ed on {closest_element['type']} element",
+                "element": f"{element_type}_element",
+                "coordinates": {"x": change_center[0], "y": change_center[1]},
+                "confidence": min(0.9, _ELEMENT_CONFIDENCE[element_type] + 0.1),
+                "bounding_box": {"x": x, "y": y, "width": width, "height": height},
+                "description": f"User {action}ed on {element_type} element",
                 "text": None  # Would be extracted via OCR in a full implementation
             }
         
@@ -310,12 +473,12 @@ class StepDetectionService:
     
     async def _analyze_current_state(
         self, 
-        ui_elements: List[Dict[str, Any]],
+        element_types: List[str],
         session_context: Dict[str, Any]
     ) -> Optional[Dict[str, Any]]:
         """Analyze current state when no previous image is available"""
         
-        if not ui_elements:
+        if not element_types:
             return None
         
         # For now, just return a generic navigation step
@@ -325,19 +488,23 @@ class StepDetectionService:
             "coordinates": None,
             "confidence": 0.5,
             "bounding_box": None,
-            "description": f"User navigated to page with {len(ui_elements)} interactive elements",
+            "description": f"User navigated to page with {len(element_types)} interactive elements",
             "text": None
         }
     
-    async def _analyze_screenshot(self, image: np.ndarray) -> Dict[str, Any]:
-        """Analyze screenshot for additional metadata"""
+    async def _analyze_screenshot(
+        self,
+        gray: np.ndarray,
+        original_shape: Optional[Tuple[int, int]] = None
+    ) -> Dict[str, Any]:
+        """Analyze grayscale screenshot for additional metadata"""
         
-        height, width = image.shape[:2]
+        height, width = original_shape or gray.shape[:2]
         
-        # Calculate basic image statistics
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        brightness = np.mean(gray)
-        contrast = np.std(gray)
+        # Calculate basic image statistics in a single pass off the event loop
+        mean, stddev = await asyncio.to_thread(cv2.meanStdDev, gray)
+        brightness = mean[0, 0]
+        contrast = stddev[0, 0]
         
         # Detect if it's likely a web page, mobile app, etc.
         page_type = "unknown"
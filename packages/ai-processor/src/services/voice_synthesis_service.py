@@ -2,16 +2,39 @@
 Voice synthesis service using ElevenLabs
 """
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional
 import httpx
 from loguru import logger
 import asyncio
+import hashlib
+import re
 import tempfile
+import textwrap
+import time
 import os
-from elevenlabs import generate, save, set_api_key, voices
+from io import BytesIO
+import orjson
+from elevenlabs import generate, set_api_key, voices
+from mutagen.mp3 import MP3
 
 from ..config import settings
 
+_TTS_MODEL = "eleven_monolingual_v1"
+
+# Whitespace following sentence-ending punctuation
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+# Spell out symbols and add pauses after punctuation in a single pass
+_SPEECH_TRANSLATION = str.maketrans({
+    "&": " and ",
+    "@": " at ",
+    "#": " number ",
+    "%": " percent ",
+    ".": ". ",
+    ",": ", ",
+    ";": "; ",
+})
+
 
 class VoiceSynthesisService:
     """Service for generating speech from text using ElevenLabs"""
@@ -19,6 +42,8 @@ class VoiceSynthesisService:
     def __init__(self):
         self.initialized = False
         self.available_voices = {}
+        # Caps concurrent ElevenLabs requests across all synthesis tasks
+        self.synthesis_slots = asyncio.Semaphore(settings.VOICE_SYNTHESIS_CONCURRENCY)
     
     async def _initialize(self):
         """Initialize the voice synthesis service"""
@@ -52,11 +77,24 @@ class VoiceSynthesisService:
         if not text:
             raise ValueError("text is required")
         
-        # Generate audio
-        audio_data, duration = await self._generate_speech(text, voice_id, voice_settings)
+        # Reject oversize text before any billable API call
+        await self._validate_text_length(text)
+        
+        # Identical text, voice and settings produce the same audio, so reuse it
+        synthesis_settings = self._synthesis_settings(voice_settings)
+        audio_path, duration_path = self._audio_cache_paths(text, voice_id, synthesis_settings)
+        duration = await asyncio.to_thread(self._cached_duration, audio_path, duration_path)
+        
+        if duration is None:
+            # Generate audio, writing it to a file as it streams in
+            duration = await self._generate_speech(
+                text, voice_id, synthesis_settings, audio_path, duration_path
+            )
+        else:
+            logger.debug(f"Speech cache HIT for {os.path.basename(audio_path)}")
         
-        # Save audio to temporary file and get URL
-        audio_url = await self._save_audio_file(audio_data)
+        # Get URL for the saved audio
+        audio_url = self._audio_url(audio_path)
         
         # Get voice metadata
         voice_metadata = await self._get_voice_metadata(voice_id)
@@ -74,20 +112,33 @@ class VoiceSynthesisService:
         }
     
     async def _load_available_voices(self):
-        """Load available voices from ElevenLabs"""
+        """Load available voices, from the local cache when it is fresh"""
+        # Key the cache on the API key so several accounts can share TEMP_DIR
+        key_hash = hashlib.sha256(settings.ELEVENLABS_API_KEY.encode()).hexdigest()[:16]
+        cache_path = os.path.join(settings.TEMP_DIR, f"voices_{key_hash}.json")
+        
+        cached_voices = await asyncio.to_thread(self._read_voices_cache, cache_path)
+        if cached_voices is not None:
+            self.available_voices = cached_voices
+            logger.info(f"Loaded {len(self.available_voices)} available voices from cache")
+            return
+        
         try:
             loop = asyncio.get_event_loop()
             voice_list = await loop.run_in_executor(None, voices)
             
-            for voice in voice_list:
-                self.available_voices[voice.voice_id] = {
+            self.available_voices = {
+                voice.voice_id: {
                     "name": voice.name,
                     "category": voice.category,
                     "description": getattr(voice, 'description', ''),
                     "preview_url": getattr(voice, 'preview_url', None)
                 }
+                for voice in voice_list
+            }
             
             logger.info(f"Loaded {len(self.available_voices)} available voices")
+            await asyncio.to_thread(self._write_voices_cache, cache_path, self.available_voices)
             
         except Exception as e:
             logger.error(f"Failed to load available voices: {e}")
@@ -98,75 +149,187 @@ class VoiceSynthesisService:
                 "description": "Default voice for synthesis"
             }
     
+    def _synthesis_settings(self, voice_settings: Dict[str, Any]) -> Dict[str, Any]:
+        """Voice settings sent to ElevenLabs, with defaults filled in"""
+        return {
+            "stability": voice_settings.get("stability", 0.75),
+            "similarity_boost": voice_settings.get("similarity_boost", 0.75),
+            "style": voice_settings.get("style", 0.0),
+            "use_speaker_boost": voice_settings.get("use_speaker_boost", True)
+        }
+    
+    def _audio_cache_paths(
+        self,
+        text: str,
+        voice_id: str,
+        synthesis_settings: Dict[str, Any]
+    ) -> tuple[str, str]:
+        """Content-addressed paths of the audio file and its duration sidecar"""
+        settings_json = orjson.dumps(synthesis_settings, option=orjson.OPT_SORT_KEYS).decode()
+        key = hashlib.sha256(
+            f"{voice_id}|{_TTS_MODEL}|{settings_json}|{text}".encode()
+        ).hexdigest()
+        base_path = os.path.join(settings.TEMP_DIR, f"tts_{key}")
+        return f"{base_path}.mp3", f"{base_path}.json"
+    
+    def _cached_duration(self, audio_path: str, duration_path: str) -> Optional[float]:
+        """Duration of previously generated audio, or None when it isn't cached"""
+        try:
+            with open(duration_path, "rb") as duration_file:
+                duration = orjson.loads(duration_file.read())["duration"]
+        except (OSError, ValueError, KeyError):
+            return None
+        
+        return duration if os.path.exists(audio_path) else None
+    
+    def _read_voices_cache(self, cache_path: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Return the cached voice list, or None when it is missing or stale"""
+        try:
+            if time.time() - os.path.getmtime(cache_path) > settings.VOICES_CACHE_TTL:
+                return None
+            with open(cache_path, "rb") as cache_file:
+                return orjson.loads(cache_file.read())
+        except (OSError, ValueError):
+            return None
+    
+    def _write_voices_cache(self, cache_path: str, available_voices: Dict[str, Dict[str, Any]]):
+        """Persist the voice list so restarts skip the ElevenLabs listing"""
+        try:
+            with open(cache_path, "wb") as cache_file:
+                cache_file.write(orjson.dumps(available_voices))
+        except OSError as e:
+            logger.warning(f"Failed to cache voice list: {e}")
+    
     async def _generate_speech(
         self, 
         text: str, 
         voice_id: str, 
-        voice_settings: Dict[str, Any]
-    ) -> tuple[bytes, float]:
-        """Generate speech from text"""
+        synthesis_settings: Dict[str, Any],
+        audio_path: str,
+        duration_path: str
+    ) -> float:
+        """Generate speech from text into audio_path, returning its duration"""
         
         try:
-            # Prepare voice settings
-            stability = voice_settings.get("stability", 0.75)
-            similarity_boost = voice_settings.get("similarity_boost", 0.75)
-            style = voice_settings.get("style", 0.0)
-            use_speaker_boost = voice_settings.get("use_speaker_boost", True)
-            
             # Generate audio in a thread to avoid blocking
             loop = asyncio.get_event_loop()
+            text_chunks = self._split_text(text)
+            audio_parts = None
             
-            def _generate():
-                return generate(
-                    text=text,
-                    voice=voice_id,
-                    model="eleven_monolingual_v1",
-                    voice_settings={
-                        "stability": stability,
-                        "similarity_boost": similarity_boost,
-                        "style": style,
-                        "use_speaker_boost": use_speaker_boost
-                    }
-                )
+            if len(text_chunks) > 1:
+                # Synthesize long text as sentence-bounded chunks in parallel; MP3
+                # frames are self-delimiting, so the parts concatenate as they are
+                async def _synthesize_chunk(text_chunk: str) -> bytes:
+                    async with self.synthesis_slots:
+                        return await loop.run_in_executor(
+                            None,
+                            lambda: b"".join(self._stream_speech(text_chunk, voice_id, synthesis_settings))
+                        )
+                
+                audio_parts = await asyncio.gather(*(_synthesize_chunk(c) for c in text_chunks))
             
-            audio_data = await loop.run_in_executor(None, _generate)
+            def _generate():
+                if audio_parts is None:
+                    audio_stream = self._stream_speech(text, voice_id, synthesis_settings)
+                else:
+                    audio_stream = audio_parts
+                
+                # Write chunks as they arrive so saving overlaps synthesis
+                with tempfile.NamedTemporaryFile(
+                    suffix=".mp3",
+                    delete=False,
+                    dir=settings.TEMP_DIR
+                ) as temp_file:
+                    try:
+                        for chunk in audio_stream:
+                            temp_file.write(chunk)
+                    except Exception:
+                        temp_file.close()
+                        os.unlink(temp_file.name)
+                        raise
+                    audio_size = temp_file.tell()
+                
+                # Read the duration from the MP3 frame headers (no audio decode); each
+                # part is measured on its own since its header only counts its frames
+                try:
+                    if audio_parts is None:
+                        duration = MP3(temp_file.name).info.length
+                    else:
+                        duration = sum(MP3(BytesIO(part)).info.length for part in audio_parts)
+                except Exception as e:
+                    logger.warning(f"Could not read MP3 duration, estimating from text: {e}")
+                    # Rough calculation: ~150 words per minute
+                    word_count = len(text.split())
+                    duration = (word_count / 150) * 60  # seconds
+                
+                # Publish the sidecar first so a visible audio file always has its duration
+                with open(duration_path, "wb") as duration_file:
+                    duration_file.write(orjson.dumps({"duration": duration}))
+                os.replace(temp_file.name, audio_path)
+                
+                return audio_size, duration
             
-            # Estimate duration (rough calculation: ~150 words per minute)
-            word_count = len(text.split())
-            estimated_duration = (word_count / 150) * 60  # seconds
+            if audio_parts is None:
+                async with self.synthesis_slots:
+                    audio_size, duration = await loop.run_in_executor(None, _generate)
+            else:
+                audio_size, duration = await loop.run_in_executor(None, _generate)
             
-            logger.debug(f"Generated speech: {len(audio_data)} bytes, ~{estimated_duration:.1f}s")
+            logger.debug(f"Generated speech: {audio_size} bytes, {duration:.1f}s")
             
-            return audio_data, estimated_duration
+            return duration
             
         except Exception as e:
             logger.error(f"Error generating speech: {e}")
             raise RuntimeError(f"Speech generation failed: {str(e)}")
     
-    async def _save_audio_file(self, audio_data: bytes) -> str:
-        """Save audio data to file and return URL"""
+    def _stream_speech(
+        self,
+        text: str,
+        voice_id: str,
+        synthesis_settings: Dict[str, Any]
+    ) -> Iterator[bytes]:
+        """Start an ElevenLabs synthesis, returning an iterator of MP3 chunks"""
+        return generate(
+            text=text,
+            voice=voice_id,
+            model=_TTS_MODEL,
+            voice_settings=synthesis_settings,
+            stream=True
+        )
+    
+    def _split_text(self, text: str) -> List[str]:
+        """Pack sentences greedily into chunks of at most VOICE_CHUNK_LENGTH characters"""
+        max_chars = settings.VOICE_CHUNK_LENGTH
+        if len(text) <= max_chars:
+            return [text]
         
-        try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(
-                suffix=".mp3", 
-                delete=False, 
-                dir=settings.TEMP_DIR
-            ) as temp_file:
-                temp_file.write(audio_data)
-                temp_path = temp_file.name
-            
-            # In a real implementation, you would upload this to S3 or similar
-            # For now, we'll return a local file URL
-            filename = os.path.basename(temp_path)
-            audio_url = f"/tmp/audio/{filename}"
-            
-            logger.debug(f"Saved audio file: {audio_url}")
-            return audio_url
-            
-        except Exception as e:
-            logger.error(f"Error saving audio file: {e}")
-            raise RuntimeError(f"Failed to save audio file: {str(e)}")
+        chunks = []
+        current = ""
+        for sentence in _SENTENCE_BOUNDARY.split(text):
+            # A sentence that can't fit in one chunk is broken at word boundaries
+            pieces = [sentence] if len(sentence) <= max_chars else textwrap.wrap(sentence, max_chars)
+            for piece in pieces:
+                if current and len(current) + 1 + len(piece) > max_chars:
+                    chunks.append(current)
+                    current = piece
+                else:
+                    current = f"{current} {piece}" if current else piece
+        
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    def _audio_url(self, audio_path: str) -> str:
+        """Return the URL for a saved audio file"""
+        
+        # In a real implementation, you would upload this to S3 or similar
+        # For now, we'll return a local file URL
+        filename = os.path.basename(audio_path)
+        audio_url = f"/tmp/audio/{filename}"
+        
+        logger.debug(f"Saved audio file: {audio_url}")
+        return audio_url
     
     async def _get_voice_metadata(self, voice_id: str) -> Dict[str, Any]:
         """Get metadata for a voice"""
@@ -191,8 +354,8 @@ class VoiceSynthesisService:
     async def _validate_text_length(self, text: str) -> bool:
         """Validate text length for synthesis"""
         
-        # ElevenLabs has character limits depending on subscription
-        max_chars = 5000  # Adjust based on your subscription
+        # Longer texts are synthesized in chunks, but bound the total cost
+        max_chars = settings.VOICE_MAX_TEXT_LENGTH
         
         if len(text) > max_chars:
             raise ValueError(f"Text too long: {len(text)} characters (max: {max_chars})")
@@ -202,16 +365,8 @@ class VoiceSynthesisService:
     async def _preprocess_text(self, text: str) -> str:
         """Preprocess text for better speech synthesis"""
         
-        # Remove or replace problematic characters
-        processed_text = text.replace("&", "and")
-        processed_text = processed_text.replace("@", "at")
-        processed_text = processed_text.replace("#", "number")
-        processed_text = processed_text.replace("%", "percent")
-        
-        # Add pauses for better speech flow
-        processed_text = processed_text.replace(".", ". ")
-        processed_text = processed_text.replace(",", ", ")
-        processed_text = processed_text.replace(";", "; ")
+        # Replace problematic characters and add pauses for better speech flow
+        processed_text = text.translate(_SPEECH_TRANSLATION)
         
         # Remove extra whitespace
         processed_text = " ".join(processed_text.split())
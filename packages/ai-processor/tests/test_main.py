@@ -0,0 +1,19 @@
+"""
+Tests for application-level error handling
+"""
+
+from fastapi.testclient import TestClient
+
+from main import app
+
+
+def test_unhandled_error_returns_500_with_cors_headers():
+    """Unexpected route errors become a 500 that still carries CORS headers"""
+    # Without the lifespan no queue service is attached, so the route fails
+    client = TestClient(app)
+    
+    response = client.get("/api/v1/tasks/missing", headers={"Origin": "https://app.example.com"})
+    
+    assert response.status_code == 500
+    assert response.headers["access-control-allow-origin"] == "*"
+    assert "queue" in response.json()["detail"]
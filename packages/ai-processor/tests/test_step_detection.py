@@ -0,0 +1,55 @@
+"""
+Tests for step detection on large screenshots
+"""
+
+import asyncio
+
+import cv2
+import numpy as np
+
+from src.services.step_detection_service import StepDetectionService
+
+
+def _screenshot(shift: int = 0) -> bytes:
+    """JPEG of a 3840x2400 screen with outlined controls and one moving filled button"""
+    image = np.full((2400, 3840, 3), 235, np.uint8)
+    rng = np.random.default_rng(5)
+    for _ in range(30):
+        x, y = (int(v) for v in rng.integers(0, (3500, 2200)))
+        w, h = (int(v) for v in rng.integers((60, 40), (400, 120)))
+        cv2.rectangle(image, (x, y), (x + w, y + h), (60, 60, 60), 3)
+    cv2.putText(image, "Sign in", (400, 300), cv2.FONT_HERSHEY_SIMPLEX, 3, (30, 30, 30), 6)
+    cv2.rectangle(image, (1000 + shift, 1000), (1300 + shift, 1080), (20, 120, 200), -1)
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+
+def test_large_screenshots_match_full_resolution_detection():
+    """Screenshots over twice the old analysis size give the same steps as a full-resolution decode"""
+    screenshots = {"current": _screenshot(), "previous": _screenshot(shift=200)}
+    service = StepDetectionService()
+    
+    async def download(url):
+        return await asyncio.to_thread(service._decode_image, screenshots[url])
+    
+    service._download_image = download
+    
+    async def run():
+        result = await service.process({"screenshot_url": "current", "previous_screenshot_url": "previous"})
+        
+        # Reference: detectors run directly on the full-resolution decode
+        current, previous = (
+            cv2.cvtColor(cv2.imdecode(np.frombuffer(screenshots[name], np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2GRAY)
+            for name in ("current", "previous")
+        )
+        steps = await service._detect_steps(current, previous, {}, 1.0)
+        analysis = await service._analyze_screenshot(current, current.shape)
+        await service.close()
+        return result, steps, analysis
+    
+    result, steps, analysis = asyncio.run(run())
+    
+    assert result["processing_metadata"]["image_dimensions"] == (2400, 3840)
+    assert steps and result["detected_steps"] == steps
+    result["screenshot_analysis"].pop("analysis_timestamp")
+    analysis.pop("analysis_timestamp")
+    assert result["screenshot_analysis"] == analysis